@@ -9,14 +9,3 @@ class SubscriptionError(APIException):
         ' попытка повторной подписки на того же автора.'
     )
     default_code = 'subscription_error'
-
-
-class IngredientRecipeCreateUpdateError(APIException):
-    status_code = 400
-    default_detail = (
-        'Ошибка создания/редактирования рецепта:'
-        ' рецепт не может содержать'
-        ' дублирующихся ингредиентов. '
-        'Удалите дублирующиеся ингредиенты'
-    )
-    default_code = 'recipe_create_update_error'
@@ -0,0 +1,133 @@
+import base64
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.relations import (
+    MANY_RELATION_KWARGS,
+    ManyRelatedField,
+    PrimaryKeyRelatedField,
+)
+
+BASE64_MARKER = ';base64,'
+BASE64_CHUNK_SIZE = 4 * 16 * 1024
+
+IMAGE_FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+class RecipeImageField(Base64ImageField):
+    """Изображение в base64 или файлом из multipart-запроса.
+
+    Base64 декодируется кусками во временный файл, который остаётся в
+    памяти только до RECIPE_IMAGE_SPOOL_SIZE байт. Pillow читает лишь
+    заголовок изображения и проверяет файл без полного декодирования
+    пикселей.
+    """
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if isinstance(data, str):
+            file = self.decode_base64(data)
+        elif hasattr(data, 'read'):
+            file = data
+        else:
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        extension = self.validate_image(file)
+        return File(file, name=f'{uuid.uuid4()}.{extension}')
+
+    def decode_base64(self, data):
+        start = data.find(BASE64_MARKER)
+        start = 0 if start < 0 else start + len(BASE64_MARKER)
+        file = SpooledTemporaryFile(max_size=settings.RECIPE_IMAGE_SPOOL_SIZE)
+        size = 0
+        pending = ''
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                pending += ''.join(
+                    data[offset:offset + BASE64_CHUNK_SIZE].split()
+                )
+                aligned = len(pending) // 4 * 4
+                chunk = base64.b64decode(pending[:aligned], validate=True)
+                pending = pending[aligned:]
+                size += len(chunk)
+                if size > settings.RECIPE_IMAGE_MAX_SIZE:
+                    raise ValidationError('Изображение слишком большое.')
+                file.write(chunk)
+            if pending:
+                raise ValueError
+        except (TypeError, binascii.Error, ValueError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        file.seek(0)
+        return file
+
+    def validate_image(self, file):
+        try:
+            image = Image.open(file)
+            width, height = image.size
+            if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+                raise ValidationError('Изображение слишком большое.')
+            image_format = image.format
+            image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        if image_format not in IMAGE_FORMATS:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        file.seek(0)
+        return IMAGE_FORMATS[image_format]
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Список первичных ключей, разрешаемый одним запросом id__in.
+
+    Обычный ManyRelatedField делает отдельный запрос на каждый элемент
+    и останавливается на первом несуществующем. Здесь в ошибке
+    перечисляются все несуществующие id, а порядок и повторы элементов
+    сохраняются для последующей валидации.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+            try:
+                pks.append(int(item))
+            except (TypeError, ValueError):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+        objects = self.child_relation.get_queryset().in_bulk(set(pks))
+        missing = sorted(set(pks) - set(objects))
+        if missing:
+            raise serializers.ValidationError(
+                'Несуществующие id: ' + ', '.join(map(str, missing))
+            )
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
@@ -1,8 +1,11 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters import filters
 from django_filters.rest_framework import BooleanFilter, FilterSet
 from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe, Tag
+from recipes.search import ingredient_index
 
 
 class RecipeFilter(FilterSet):
@@ -10,10 +13,15 @@ class RecipeFilter(FilterSet):
         queryset=Tag.objects.all(),
         field_name='tags__slug',
         to_field_name='slug',
+        method='filter_tags',
     )
     author = filters.CharFilter(field_name="author", method='filter_author')
     is_favorited = BooleanFilter(method='get_favorited')
     is_in_shopping_cart = BooleanFilter(method='get_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Сначала самые популярные'),),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
@@ -23,6 +31,28 @@ class RecipeFilter(FilterSet):
             'is_favorited',
         ]
 
+    def filter_tags(self, queryset, name, tags):
+        """Рецепты хотя бы с одним из тегов.
+
+        EXISTS по промежуточной таблице вместо JOIN не размножает строки
+        рецептов, поэтому не нужен DISTINCT с сортировкой всей выборки.
+        """
+        if not tags:
+            return queryset
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'),
+                    tag__in=tags,
+                )
+            )
+        )
+
+    def filter_ordering(self, queryset, name, ordering):
+        if ordering == 'popular':
+            return queryset.order_by('-favorites_count', '-id')
+        return queryset
+
     def filter_author(self, queryset, id, author):
         return queryset.filter(author=author)
 
@@ -45,3 +75,11 @@ class RecipeFilter(FilterSet):
 
 class IngredientFilter(SearchFilter):
     search_param = 'name'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or view.action != 'list':
+            return super().filter_queryset(request, queryset, view)
+        return ingredient_index.search(
+            query, settings.INGREDIENT_SEARCH_LIMIT
+        )
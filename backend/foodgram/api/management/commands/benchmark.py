@@ -0,0 +1,331 @@
+import base64
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes import shopping_list
+from recipes.images import IMAGE_VARIANTS, get_variant_name
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User
+
+CART_SIZES = (5, 50, 500)
+CART_FORMATS = ('pdf', 'txt', 'csv', 'json')
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), '#C0843D').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def get_recipe_data(ingredients_count):
+    ingredients = Ingredient.objects.order_by('id').values_list(
+        'id', flat=True
+    )[:ingredients_count]
+    return {
+        'name': f'Замер на {ingredients_count} ингредиентов',
+        'text': 'Рецепт для замера записи',
+        'cooking_time': 10,
+        'image': get_image_data(),
+        'tags': list(Tag.objects.values_list('id', flat=True)[:3]),
+        'ingredients': [
+            {'id': ingredient, 'amount': 10} for ingredient in ingredients
+        ],
+    }
+
+
+def delete_recipe(response):
+    recipe = Recipe.objects.get(pk=response.json()['id'])
+    storage = recipe.image.storage
+    for variant in IMAGE_VARIANTS:
+        storage.delete(get_variant_name(recipe.image.name, variant))
+    recipe.image.delete(save=False)
+    recipe.delete()
+
+
+def get_response_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа и число SQL-запросов основных эндпоинтов '
+        'API и сохраняет результат в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кэш перед каждым запросом',
+        )
+        parser.add_argument(
+            '--only', nargs='*', help='Запустить только указанные сценарии'
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего запуска для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        scenarios = self.get_scenarios()
+        cart_scenarios = {
+            f'shopping_cart_{format}_{size}': (size, format)
+            for size in CART_SIZES
+            for format in CART_FORMATS
+        }
+        if options['only']:
+            unknown = (
+                set(options['only']) - set(scenarios) - set(cart_scenarios)
+            )
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+                )
+            scenarios = {
+                name: scenarios[name]
+                for name in options['only']
+                if name in scenarios
+            }
+            cart_scenarios = {
+                name: cart_scenarios[name]
+                for name in options['only']
+                if name in cart_scenarios
+            }
+        results = {
+            name: self.run_scenario(client, url, *data, **options)
+            for name, (client, url, *data) in scenarios.items()
+        }
+        results.update(self.run_cart_scenarios(cart_scenarios, **options))
+        report = {
+            'meta': {
+                'commit': get_git_commit(),
+                'date': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'repeat': options['repeat'],
+                'cold': options['cold'],
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'results': results,
+        }
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['results']
+        self.print_report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def get_client(self, relation):
+        """Клиент от имени пользователя с наибольшим числом связей."""
+        user = (
+            User.objects.annotate(activity=Count(relation))
+            .order_by('-activity', 'id')
+            .first()
+        )
+        if user is None:
+            raise CommandError(
+                'Нет данных для замеров, запустите generate_fake_data'
+            )
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def get_scenarios(self):
+        recipe = (
+            Recipe.objects.annotate(favorites=Count('favorited_recipe'))
+            .order_by('-favorites', 'id')
+            .first()
+        )
+        if recipe is None:
+            raise CommandError(
+                'Нет данных для замеров, запустите generate_fake_data'
+            )
+        tags = '&'.join(
+            f'tags={slug}'
+            for slug in Tag.objects.values_list('slug', flat=True)[:3]
+        )
+        ingredient = Ingredient.objects.order_by('id').first()
+        prefix = ingredient.name[:3] if ingredient else 'а'
+        anonymous = APIClient()
+        client = self.get_client('favorited_user')
+        subscriber = self.get_client('subscriber')
+        return {
+            'recipes_list': (anonymous, '/api/recipes/'),
+            'recipes_list_auth': (client, '/api/recipes/'),
+            'recipes_list_cursor': (client, '/api/recipes/?cursor='),
+            'recipes_page_last': (
+                client,
+                f'/api/recipes/?page={max(Recipe.objects.count() // 6, 1)}',
+            ),
+            'recipe_detail': (client, f'/api/recipes/{recipe.id}/'),
+            'recipes_filter_tags': (client, f'/api/recipes/?{tags}'),
+            'recipes_filter_author': (
+                client,
+                f'/api/recipes/?author={recipe.author_id}',
+            ),
+            'recipes_filter_favorited': (
+                client,
+                '/api/recipes/?is_favorited=1',
+            ),
+            'subscriptions': (
+                subscriber,
+                '/api/users/subscriptions/?recipes_limit=3',
+            ),
+            'ingredient_search': (
+                anonymous,
+                f'/api/ingredients/?name={prefix}',
+            ),
+            'tags_list': (anonymous, '/api/tags/'),
+            'recipe_create_5': (client, '/api/recipes/', get_recipe_data(5)),
+            'recipe_create_50': (
+                client,
+                '/api/recipes/',
+                get_recipe_data(50),
+            ),
+            'recipe_create_500': (
+                client,
+                '/api/recipes/',
+                get_recipe_data(500),
+            ),
+        }
+
+    def create_cart(self, size):
+        """Клиент пользователя с корзиной из size первых рецептов."""
+        recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)[:size]
+        )
+        if len(recipe_ids) < size:
+            raise CommandError(
+                f'Для корзины на {size} рецептов не хватает рецептов, '
+                'запустите generate_fake_data'
+            )
+        user = User.objects.create_user(
+            email=f'benchmark_cart_{size}@example.com',
+            username=f'benchmark_cart_{size}',
+            first_name='Замер',
+            last_name='Корзины',
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(shoppingcart_user=user, shoppingcart_recipe_id=pk)
+            for pk in recipe_ids
+        )
+        shopping_list.add_recipes(user.pk, recipe_ids)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def run_cart_scenarios(self, scenarios, **options):
+        """Выгрузка списка покупок для корзин фиксированного размера.
+
+        Корзины собираются в транзакции, которая откатывается после
+        замеров, поэтому счётчики рецептов и данные не меняются. Без
+        --cold повторная выгрузка PDF берётся из кэша.
+        """
+        results = {}
+        for size in sorted({size for size, _ in scenarios.values()}):
+            with transaction.atomic():
+                client = self.create_cart(size)
+                for name, (cart_size, format) in scenarios.items():
+                    if cart_size == size:
+                        results[name] = self.run_scenario(
+                            client,
+                            '/api/recipes/download_shopping_cart/'
+                            f'?format={format}',
+                            **options,
+                        )
+                transaction.set_rollback(True)
+        return {name: results[name] for name in scenarios}
+
+    def run_scenario(
+        self, client, url, data=None, *, repeat, warmup, cold, **options
+    ):
+        """GET по url или, если задан data, POST с созданием рецепта.
+
+        Созданный рецепт удаляется после замера вместе с изображением.
+        """
+        timings = []
+        queries = []
+        for iteration in range(warmup + repeat):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                if data is None:
+                    response = client.get(url)
+                else:
+                    response = client.post(url, data, format='json')
+                size = get_response_size(response)
+                elapsed = time.perf_counter() - started
+            if data is not None and response.status_code == 201:
+                delete_recipe(response)
+            elif response.status_code != 200:
+                raise CommandError(
+                    f'{url}: статус {response.status_code}'
+                )
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(context.captured_queries))
+        timings.sort()
+        return {
+            'url': url,
+            'min_ms': timings[0],
+            'median_ms': statistics.median(timings),
+            'p95_ms': timings[min(int(0.95 * len(timings)), len(timings) - 1)],
+            'mean_ms': statistics.mean(timings),
+            'queries': max(queries),
+            'size': size,
+        }
+
+    def print_report(self, results, previous):
+        for name, result in results.items():
+            line = (
+                f'{name:28} {result["median_ms"]:9.2f} мс '
+                f'(p95 {result["p95_ms"]:.2f}) '
+                f'{result["queries"]:4} запр. {result["size"]:8} байт'
+            )
+            if previous and name in previous:
+                before = previous[name]
+                change = (
+                    result['median_ms'] / before['median_ms'] - 1
+                    if before['median_ms'] else 0
+                )
+                line += (
+                    f'  {change:+.1%}, запросов было {before["queries"]}'
+                )
+            self.stdout.write(line)
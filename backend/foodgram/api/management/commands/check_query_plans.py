@@ -0,0 +1,129 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.utils import (
+    annotate_recipe_flags,
+    get_feed_recipes_queryset,
+    get_shoppingcart_ingredients_queryset,
+    get_subscriptions_queryset,
+)
+from foodgram.explain import (
+    SEQUENTIAL_SCAN_PATTERNS,
+    find_sequential_scans,
+    get_table_sizes,
+)
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+PAGE_SIZE = 6
+
+# SQLite показывает обход по rowid в порядке ORDER BY id DESC LIMIT как
+# SCAN, хотя он останавливается на первой странице, а регистронезависимый
+# LIKE в SQLite не использует индексы вовсе. В PostgreSQL для тех же
+# запросов используются Index Scan Backward и индексы из миграции 0014.
+SQLITE_ALLOWED_SCANS = {
+    'recipes_list': {'recipes_recipe'},
+    'recipes_filter_tags': {'recipes_recipe'},
+    'ingredient_search': {'recipes_ingredient'},
+}
+
+
+def filter_recipes(user, **params):
+    request = RequestFactory().get('/api/recipes/', params)
+    request.user = user
+    return RecipeFilter(
+        request.GET,
+        annotate_recipe_flags(Recipe.objects.all(), user),
+        request=request,
+    ).qs[:PAGE_SIZE]
+
+
+def get_hot_queries(user):
+    authors = list(
+        user.subscriber.values_list('subscribed_to', flat=True)[:PAGE_SIZE]
+    )
+    tags = list(Tag.objects.values_list('slug', flat=True)[:3])
+    return {
+        'recipes_list': filter_recipes(user),
+        'recipes_filter_tags': filter_recipes(user, tags=tags),
+        'recipes_filter_author': filter_recipes(user, author=user.id),
+        'recipes_filter_favorited': filter_recipes(user, is_favorited=1),
+        'recipes_popular': filter_recipes(user, ordering='popular'),
+        'recipes_filter_shopping_cart': filter_recipes(
+            user, is_in_shopping_cart=1
+        ),
+        'subscriptions': get_subscriptions_queryset(user)[:PAGE_SIZE],
+        'subscriptions_feed': get_feed_recipes_queryset(user, 3).filter(
+            author__in=authors
+        ),
+        'shopping_cart': get_shoppingcart_ingredients_queryset(user),
+        'ingredient_search': Ingredient.objects.filter(
+            name__istartswith='са'
+        )[:50],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет через EXPLAIN, что горячие запросы API не читают '
+        'большие таблицы целиком; завершается ошибкой, если читают'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='Полный просмотр таблиц меньшего размера допустим',
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true', help='Печатать планы'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQUENTIAL_SCAN_PATTERNS:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Планы {connection.vendor} не разбираются, '
+                    'проверка пропущена'
+                )
+            )
+            return
+        user = (
+            User.objects.annotate(activity=Count('subscriber'))
+            .order_by('-activity', 'id')
+            .first()
+        )
+        if user is None:
+            raise CommandError(
+                'Нет данных для проверки, запустите generate_fake_data'
+            )
+        table_sizes = get_table_sizes()
+        failures = {}
+        for name, queryset in get_hot_queries(user).items():
+            if options['verbose_plans']:
+                self.stdout.write(f'== {name}\n{queryset.explain()}')
+            scans = set(
+                find_sequential_scans(
+                    queryset, options['min_rows'], table_sizes
+                )
+            )
+            if connection.vendor == 'sqlite':
+                scans -= SQLITE_ALLOWED_SCANS.get(name, set())
+            if scans:
+                failures[name] = sorted(scans)
+            self.stdout.write(
+                f'{name:30} '
+                + (', '.join(sorted(scans)) if scans else 'OK')
+            )
+        if failures:
+            raise CommandError(
+                'Полный просмотр таблиц в запросах: '
+                + '; '.join(
+                    f'{name} ({", ".join(tables)})'
+                    for name, tables in failures.items()
+                )
+            )
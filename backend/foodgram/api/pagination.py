@@ -1,6 +1,52 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class TruncatedListPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class TruncatedListCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = '-id'
+
+
+class TruncatedFeedPagination(TruncatedListPagination):
+    """Постраничная пагинация с включаемым режимом курсора.
+
+    Без параметра cursor работает как TruncatedListPagination. С ним,
+    в том числе пустым для первой страницы, выборка режется по id без
+    COUNT(*) и OFFSET, а в ответе нет поля count.
+
+    Курсор строится только по неизменяемому уникальному id. Если
+    фильтры задали другой порядок (ordering=popular сортирует по
+    меняющемуся favorites_count), параметр cursor игнорируется и
+    выборка делится на страницы по номеру.
+    """
+
+    cursor_pagination_class = TruncatedListCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        cursor_ordering = self.cursor_pagination_class.ordering
+        if cursor_query_param not in request.query_params or (
+            queryset.query.order_by
+            and tuple(queryset.query.order_by) != (cursor_ordering,)
+        ):
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = self.cursor_pagination_class()
+        return self.cursor_paginator.paginate_queryset(
+            queryset, request, view
+        )
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is None:
+            return super().get_paginated_response(data)
+        return self.cursor_paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        if self.cursor_paginator is None:
+            return super().get_paginated_response_schema(schema)
+        return self.cursor_paginator.get_paginated_response_schema(schema)
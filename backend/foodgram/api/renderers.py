@@ -0,0 +1,145 @@
+import csv
+from abc import ABCMeta, abstractmethod
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from api.utils import get_shoppingcart_pdf
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def format_shoppingcart_line(item):
+    if item['total_amount'] is None:
+        return f'{item["name"]} - {item["measurement_unit"]}'
+    return (
+        f'{item["name"]} - {item["total_amount"]} {item["measurement_unit"]}'
+    )
+
+
+class ShoppingCartRenderer(BaseRenderer, metaclass=ABCMeta):
+    """Список покупок, который можно отдавать построчно."""
+
+    charset = 'utf-8'
+
+    @abstractmethod
+    def stream(self, data):
+        """Строки файла для ингредиентов data."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(self.stream(data)).encode(self.charset)
+
+
+class PlainTextRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, data):
+        for item in data:
+            yield format_shoppingcart_line(item) + '\n'
+
+
+class CSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, data):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for item in data:
+            yield writer.writerow(
+                (item['name'], item['measurement_unit'], item['total_amount'])
+            )
+
+
+class PDFRenderer(BaseRenderer):
+    """PDF списка покупок, собранный целиком.
+
+    Таблица перекрёстных ссылок и подмножество шрифта попадают в файл
+    только после последней страницы, поэтому ReportLab не отдаёт
+    страницы по мере готовности. Готовый PDF кэшируется, а клиенту
+    уходит блоками через FileResponse; без буфера потоком пишутся
+    только txt и csv.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return get_shoppingcart_pdf(
+            [format_shoppingcart_line(item) for item in data]
+        )
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Метрики профилирования в текстовом формате Prometheus."""
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+    summaries = (
+        ('duration', 'request_duration_seconds'),
+        ('queries', 'request_queries'),
+        ('sql_time', 'request_sql_seconds'),
+        ('serialization_time', 'request_serialization_seconds'),
+        ('render_time', 'request_render_seconds'),
+        ('size', 'response_size_bytes'),
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if 'endpoints' not in data:
+            return '\n'.join(
+                f'# {key}: {value}' for key, value in data.items()
+            ).encode(self.charset)
+        return ''.join(self.stream(data)).encode(self.charset)
+
+    def stream(self, data):
+        endpoints = data['endpoints']
+        yield '# TYPE foodgram_request_duration_histogram_seconds histogram\n'
+        for endpoint, stats in endpoints.items():
+            cumulative = 0
+            for bound, count in stats['buckets'].items():
+                cumulative += count
+                yield (
+                    'foodgram_request_duration_histogram_seconds_bucket'
+                    f'{{endpoint="{endpoint}",le="{bound}"}} {cumulative}\n'
+                )
+            yield (
+                'foodgram_request_duration_histogram_seconds_bucket'
+                f'{{endpoint="{endpoint}",le="+Inf"}} {stats["count"]}\n'
+                'foodgram_request_duration_histogram_seconds_sum'
+                f'{{endpoint="{endpoint}"}} {stats["sums"]["duration"]}\n'
+                'foodgram_request_duration_histogram_seconds_count'
+                f'{{endpoint="{endpoint}"}} {stats["count"]}\n'
+            )
+        for field, name in self.summaries:
+            yield f'# TYPE foodgram_{name} summary\n'
+            for endpoint, stats in endpoints.items():
+                for quantile, value in stats['quantiles'][field].items():
+                    yield (
+                        f'foodgram_{name}'
+                        f'{{endpoint="{endpoint}",quantile="{quantile}"}} '
+                        f'{value}\n'
+                    )
+                yield (
+                    f'foodgram_{name}_sum{{endpoint="{endpoint}"}} '
+                    f'{stats["sums"][field]}\n'
+                    f'foodgram_{name}_count{{endpoint="{endpoint}"}} '
+                    f'{stats["count"]}\n'
+                )
+        for group in ('db_connections', 'recipe_cache'):
+            for key, value in data[group].items():
+                yield f'# TYPE foodgram_{group}_{key} gauge\n'
+                yield f'foodgram_{group}_{key} {value}\n'
+
+
+SHOPPINGCART_RENDERERS = (
+    PDFRenderer,
+    PlainTextRenderer,
+    CSVRenderer,
+    JSONRenderer,
+)
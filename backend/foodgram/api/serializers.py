@@ -1,25 +1,34 @@
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Manager, prefetch_related_objects
+from django.urls import reverse
 from django.utils import timezone
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import CurrentUserDefault
-from rest_framework.relations import PrimaryKeyRelatedField
 
-from api.exceptions import (
-    SubscriptionError,
-    IngredientRecipeCreateUpdateError,
-)
+from api.exceptions import SubscriptionError
+from api.fields import BulkPrimaryKeyRelatedField, RecipeImageField
+from api.renderers import SHOPPINGCART_RENDERERS
 from api.utils import (
+    RECIPE_READ_PREFETCHES,
+    format_ids,
+    get_duplicates,
     process_custom_context,
     process_recipe_ingredients_data,
 )
+from jobs.models import Job
+from jobs.queue import enqueue
+from recipes.cache import get_recipes, invalidate_recipes, set_recipes
+from recipes.images import create_image_variants, get_image_variant_urls
 from recipes.models import (
     Favorite,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 from users.models import Subscription, User
@@ -55,8 +64,7 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class UserRecipeReadSerializer(serializers.ModelSerializer):
-    is_subscribed = serializers.SerializerMethodField()
+class UserRecipeBaseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
@@ -66,12 +74,21 @@ class UserRecipeReadSerializer(serializers.ModelSerializer):
             'email',
             'id',
             'username',
-            'is_subscribed',
         )
         read_only_fields = fields
         depth = 1
 
+
+class UserRecipeReadSerializer(UserRecipeBaseSerializer):
+    is_subscribed = serializers.SerializerMethodField()
+
+    class Meta(UserRecipeBaseSerializer.Meta):
+        fields = UserRecipeBaseSerializer.Meta.fields + ('is_subscribed',)
+        read_only_fields = fields
+
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         try:
             user = self.context.get('request').user
             if user.is_anonymous:
@@ -89,12 +106,13 @@ class UserRecipeReadSerializer(serializers.ModelSerializer):
             )
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadBaseSerializer(serializers.ModelSerializer):
+    """Часть представления рецепта, общая для всех пользователей."""
+
     tags = TagSerializer(many=True, read_only=True)
     image = Base64ImageField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
-    author = UserRecipeReadSerializer(read_only=True)
+    image_variants = serializers.SerializerMethodField()
+    author = UserRecipeBaseSerializer(read_only=True)
     ingredients = IngredientRecipeSerializer(
         many=True, source='RecipeIngredients'
     )
@@ -107,16 +125,74 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'author',
             'text',
             'image',
+            'image_variants',
             'created',
             'cooking_time',
             'ingredients',
             'tags',
+        )
+        depth = 1
+
+    def get_image_variants(self, obj):
+        return get_image_variant_urls(obj.image)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return [
+            self.child.add_user_fields(recipe, representation)
+            for recipe, representation in zip(
+                recipes, get_cached_recipe_representations(recipes)
+            )
+        ]
+
+
+class RecipeReadSerializer(RecipeReadBaseSerializer):
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    author = UserRecipeReadSerializer(read_only=True)
+
+    class Meta(RecipeReadBaseSerializer.Meta):
+        fields = RecipeReadBaseSerializer.Meta.fields + (
             'is_favorited',
             'is_in_shopping_cart',
         )
-        depth = 1
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        (representation,) = get_cached_recipe_representations([instance])
+        return self.add_user_fields(instance, representation)
+
+    def add_user_fields(self, instance, representation):
+        request = self.context.get('request')
+        if request is not None:
+            if representation['image']:
+                representation['image'] = request.build_absolute_uri(
+                    representation['image']
+                )
+            for variant, url in representation['image_variants'].items():
+                representation['image_variants'][variant] = (
+                    request.build_absolute_uri(url)
+                )
+        representation['author']['is_subscribed'] = (
+            self.get_author_is_subscribed(instance)
+        )
+        representation['is_favorited'] = self.get_is_favorited(instance)
+        representation['is_in_shopping_cart'] = self.get_is_in_shopping_cart(
+            instance
+        )
+        return representation
+
+    def get_author_is_subscribed(self, obj):
+        if hasattr(obj, 'author_is_subscribed'):
+            return obj.author_is_subscribed
+        return self.fields['author'].get_is_subscribed(obj.author)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         try:
             user = self.context.get('request').user
             if user.is_anonymous:
@@ -134,6 +210,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         try:
             user = self.context.get('request').user
             if user.is_anonymous:
@@ -151,8 +229,29 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             )
 
 
+def get_cached_recipe_representations(recipes):
+    """Представления рецептов из кэша; промахи собираются одним проходом.
+
+    Связи подгружаются только для рецептов, которых нет в кэше. Ссылка
+    на изображение хранится относительной, а флаги пользователя
+    добавляет RecipeReadSerializer.add_user_fields.
+    """
+    recipes = list(recipes)
+    cached = get_recipes([recipe.pk for recipe in recipes])
+    missing = [recipe for recipe in recipes if recipe.pk not in cached]
+    if missing:
+        prefetch_related_objects(missing, *RECIPE_READ_PREFETCHES)
+        fresh = {
+            recipe.pk: RecipeReadBaseSerializer(recipe).data
+            for recipe in missing
+        }
+        set_recipes(fresh)
+        cached.update(fresh)
+    return [cached[recipe.pk] for recipe in recipes]
+
+
 class IngredientAmountRecognizeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -161,12 +260,14 @@ class IngredientAmountRecognizeSerializer(serializers.ModelSerializer):
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
-    tags = PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+    tags = BulkPrimaryKeyRelatedField(
+        many=True, queryset=Tag.objects.all()
+    )
     ingredients = IngredientAmountRecognizeSerializer(
         many=True, write_only=True
     )
     author = serializers.HiddenField(default=CurrentUserDefault())
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -184,52 +285,90 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         depth = 1
 
     def validate_tags(self, value):
-        try:
-            if not value:
-                raise ValidationError({'tags': 'Отсутвует тег'})
-            tags_list = []
-            for tag in value:
-                if tag in tags_list:
-                    raise ValidationError({'tags': 'Теги дублируются'})
-                tags_list.append(tag)
-            return value
-        except ValidationError as e:
-            raise IngredientRecipeCreateUpdateError(e)
+        if not value:
+            raise serializers.ValidationError('Отсутвует тег')
+        duplicates = get_duplicates(tag.pk for tag in value)
+        if duplicates:
+            raise serializers.ValidationError(
+                f'Теги дублируются: {format_ids(duplicates)}'
+            )
+        return value
 
     def validate_ingredients(self, value):
-        try:
-            if not value:
-                raise ValidationError({'ingredients': 'Выберите ингредиенты'})
-            ingredients_list = []
-            for item in value:
-                if item in ingredients_list:
-                    raise ValidationError(
-                        {'ingredients': 'Ингридиенты дублируются'}
-                    )
-                if int(item['amount']) <= 0:
-                    raise ValidationError(
-                        {'amount': 'Выберите число большее 0'}
-                    )
-                ingredients_list.append(item)
-            return value
-        except ValidationError as e:
-            raise IngredientRecipeCreateUpdateError(e)
+        """Проверяет все ингредиенты разом и одним запросом к базе.
+
+        В ошибке перечисляются все повторяющиеся и несуществующие id
+        и все ингредиенты с неположительным количеством. Ошибки - это
+        ValidationError, поэтому DRF сообщает их вместе с ошибками
+        остальных полей, например тегов.
+        """
+        if not value:
+            raise serializers.ValidationError('Выберите ингредиенты')
+        ids = [item['id'] for item in value]
+        errors = []
+        duplicates = get_duplicates(ids)
+        if duplicates:
+            errors.append(
+                f'Ингридиенты дублируются: {format_ids(duplicates)}'
+            )
+        existing = set(
+            Ingredient.objects.filter(id__in=set(ids)).values_list(
+                'id', flat=True
+            )
+        )
+        missing = sorted(set(ids) - existing)
+        if missing:
+            errors.append(
+                f'Несуществующие ингредиенты: {format_ids(missing)}'
+            )
+        wrong_amounts = [item['id'] for item in value if item['amount'] <= 0]
+        if wrong_amounts:
+            errors.append(
+                'Выберите число большее 0 для ингредиентов: '
+                f'{format_ids(wrong_amounts)}'
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
+
+    def get_ingredient_amounts(self, ingredients):
+        return {item['id']: item['amount'] for item in ingredients}
 
     def create(self, validated_data):
         tags = validated_data.pop('tags')
-        validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        process_recipe_ingredients_data(self, recipe)
-        recipe.tags.set(tags)
+        ingredients = self.get_ingredient_amounts(
+            validated_data.pop('ingredients')
+        )
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            process_recipe_ingredients_data(recipe, ingredients, created=True)
+            recipe.tags.set(tags)
+        self.process_image(recipe)
         return recipe
 
     def update(self, instance, validated_data):
-        validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        process_recipe_ingredients_data(self, instance)
-        tags = validated_data.pop('tags')
-        instance.tags.set(tags)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        with transaction.atomic():
+            if ingredients is not None:
+                process_recipe_ingredients_data(
+                    instance, self.get_ingredient_amounts(ingredients)
+                )
+            if tags is not None:
+                instance.tags.set(tags)
+            instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            self.process_image(instance)
+        return instance
+
+    def process_image(self, recipe):
+        if not recipe.image:
+            return
+        if settings.RECIPE_IMAGE_VARIANTS_ASYNC:
+            enqueue('create_recipe_image_variants', recipe_id=recipe.pk)
+            return
+        create_image_variants(recipe.image)
+        invalidate_recipes([recipe.pk])
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -272,6 +411,26 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         depth = 1
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'total_amount')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT,
+    )
+
+
 class ShoppingCartDeleteSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -332,6 +491,8 @@ class UserReadSerializer(serializers.ModelSerializer):
         depth = 1
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return process_custom_context(
             instance=obj,
             modelfield_first='subscribed_to',
@@ -350,13 +511,18 @@ class UserSubscriptionSerializer(UserReadSerializer):
         fields = UserReadSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.id).count()
 
     def get_recipes(self, obj):
-        recipes = Recipe.objects.filter(author=obj.id)
-        recipes_limit = self.context.get('recipes_limit')
-        if recipes_limit:
-            recipes = recipes[: int(recipes_limit)]
+        if hasattr(obj, 'feed_recipes'):
+            recipes = obj.feed_recipes
+        else:
+            recipes = Recipe.objects.filter(author=obj.id)
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit:
+                recipes = recipes[: int(recipes_limit)]
         serializer = RecipeReadSerializer(
             recipes, many=True, read_only=True, context=self.context
         )
@@ -450,28 +616,48 @@ class SubscriptionDeleteSerializer(serializers.ModelSerializer):
         depth = 1
 
 
+class SubscriptionsListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        """Связи рецептов всей страницы подгружаются одним проходом.
+
+        Иначе get_cached_recipe_representations подгружал бы теги и
+        ингредиенты отдельно для рецептов каждого автора.
+        """
+        subscriptions = list(data.all() if isinstance(data, Manager) else data)
+        recipes = [
+            recipe
+            for subscription in subscriptions
+            for recipe in getattr(
+                subscription.subscribed_to, 'feed_recipes', ()
+            )
+        ]
+        cached = get_recipes([recipe.pk for recipe in recipes])
+        prefetch_related_objects(
+            [recipe for recipe in recipes if recipe.pk not in cached],
+            *RECIPE_READ_PREFETCHES,
+        )
+        return super().to_representation(subscriptions)
+
+
 class SubscriptionsSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
-        data = super().to_representation(instance)
-        data.pop('subscribed_to')
-        user_subscriber = data.pop('subscriber')
-        context = {}
-        context['user_subscriber'] = user_subscriber
-        context['is_list'] = True
-        try:
-            query_params_context = self.context.get('request').query_params
-            recipes_limit = query_params_context.get('recipes_limit')
-            context['recipes_limit'] = recipes_limit
-            serializer = UserSubscriptionSerializer(
-                instance.subscribed_to, context=context
+        context = dict(self.context)
+        request = context.get('request')
+        if request is None:
+            context['user_subscriber'] = {
+                'username': instance.subscriber.username
+            }
+            context['is_list'] = True
+        else:
+            context['recipes_limit'] = request.query_params.get(
+                'recipes_limit'
             )
-            return serializer.data
-        except AttributeError:
-            serializer = UserSubscriptionSerializer(
-                instance.subscribed_to, context=context
-            )
-            return serializer.data
+        serializer = UserSubscriptionSerializer(
+            instance.subscribed_to, context=context
+        )
+        return serializer.data
 
     class Meta:
         model = Subscription
@@ -481,3 +667,46 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         )
         read_only_fields = fields
         depth = 1
+        list_serializer_class = SubscriptionsListSerializer
+
+
+class JobSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            'id',
+            'task',
+            'status',
+            'error',
+            'created',
+            'started',
+            'finished',
+            'download',
+        )
+        read_only_fields = fields
+
+    def get_download(self, obj):
+        if obj.status != Job.DONE or not obj.result:
+            return None
+        request = self.context.get('request')
+        url = reverse('job_download', kwargs={'pk': obj.pk})
+        return request.build_absolute_uri(url) if request else url
+
+
+class ShoppingCartJobSerializer(serializers.Serializer):
+    format = serializers.ChoiceField(
+        choices=[renderer.format for renderer in SHOPPINGCART_RENDERERS],
+        default='pdf',
+    )
+
+    def create(self, validated_data):
+        return enqueue(
+            'render_shoppingcart',
+            user=self.context['request'].user,
+            format=validated_data['format'],
+        )
+
+    def to_representation(self, instance):
+        return JobSerializer(instance, context=self.context).data
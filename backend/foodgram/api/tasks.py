@@ -0,0 +1,16 @@
+from django.core.files.base import ContentFile
+
+from api.renderers import SHOPPINGCART_RENDERERS
+from api.utils import get_shoppingcart_ingredients
+from jobs.queue import task
+
+
+@task
+def render_shoppingcart(job, format='pdf'):
+    renderer = {
+        renderer.format: renderer for renderer in SHOPPINGCART_RENDERERS
+    }[format]()
+    return ContentFile(
+        renderer.render(get_shoppingcart_ingredients(job.user)),
+        name=f'cart_list.{format}',
+    )
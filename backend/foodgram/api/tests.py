@@ -0,0 +1,1186 @@
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+
+from api.fields import RecipeImageField
+from api.renderers import ShoppingCartRenderer
+from api.management.commands.check_query_plans import get_hot_queries
+from foodgram import db
+from foodgram.explain import find_sequential_scans, get_table_sizes
+from foodgram.profiling import registry, serializer_profiler
+from jobs.models import Job
+from jobs.queue import claim_jobs, run_job
+from recipes import shopping_list
+from recipes.cache import RECIPE_KEY
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from users.models import Subscription, User
+
+
+def create_user(index=0):
+    return User.objects.create_user(
+        email=f'user{index}@example.com',
+        username=f'user{index}',
+        password='password',
+        first_name='Имя',
+        last_name='Фамилия',
+    )
+
+
+def create_recipes(author, count, **fields):
+    return [
+        Recipe.objects.create(
+            name=f'Рецепт {index}',
+            author=author,
+            text='Описание',
+            cooking_time=5,
+            image='media/recipe.png',
+            **fields,
+        )
+        for index in range(count)
+    ]
+
+
+def add_ingredients(recipe, amounts):
+    for index, amount in enumerate(amounts):
+        ingredient, _ = Ingredient.objects.get_or_create(
+            name=f'Ингредиент {index}', measurement_unit='г'
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=amount
+        )
+
+
+class BulkShoppingCartMixin:
+    url = '/api/recipes/shopping_cart/'
+
+    def create_data(self):
+        self.user = create_user()
+        self.recipes = create_recipes(self.user, 2)
+        for recipe in self.recipes:
+            add_ingredients(recipe, (100, 5))
+
+    def get_client(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client
+
+    def post_recipes(self, client=None):
+        return (client or self.get_client()).post(
+            self.url,
+            {'recipes': [recipe.pk for recipe in self.recipes]},
+            format='json',
+        )
+
+    def assert_added_once(self):
+        self.assertEqual(
+            list(
+                Recipe.objects.order_by('id').values_list(
+                    'in_carts_count', flat=True
+                )
+            ),
+            [1, 1],
+        )
+        self.assertEqual(
+            sorted(
+                ShoppingListItem.objects.filter(user=self.user).values_list(
+                    'total_amount', flat=True
+                )
+            ),
+            [10, 200],
+        )
+
+
+class BulkShoppingCartTests(BulkShoppingCartMixin, TestCase):
+    def setUp(self):
+        self.create_data()
+
+    def test_repeated_bulk_add_counts_once(self):
+        self.assertEqual(self.post_recipes().status_code, 200)
+        response = self.post_recipes()
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['exists', 'exists'],
+        )
+        self.assert_added_once()
+
+
+@skipUnless(
+    connection.vendor == 'postgresql', 'Нужны блокировки строк PostgreSQL'
+)
+class ConcurrentBulkShoppingCartTests(
+    BulkShoppingCartMixin, TransactionTestCase
+):
+    def setUp(self):
+        self.create_data()
+
+    def test_concurrent_bulk_add_counts_once(self):
+        barrier = threading.Barrier(2)
+        statuses = []
+
+        def post():
+            client = self.get_client()
+            barrier.wait()
+            try:
+                response = self.post_recipes(client)
+                statuses.extend(
+                    item['status'] for item in response.data['results']
+                )
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(statuses), ['created'] * 2 + ['exists'] * 2)
+        self.assert_added_once()
+
+
+class RecipeValidationTests(TestCase):
+    def test_tag_and_ingredient_errors_are_reported_together(self):
+        user = create_user()
+        tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color=Tag.ORANGE
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            '/api/recipes/',
+            {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 5,
+                'tags': [tag.pk, tag.pk],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 0},
+                    {'id': ingredient.pk, 'amount': 10},
+                    {'id': 999, 'amount': 10},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['tags'], [f'Теги дублируются: {tag.pk}']
+        )
+        self.assertEqual(
+            response.data['ingredients'],
+            [
+                f'Ингридиенты дублируются: {ingredient.pk}',
+                'Несуществующие ингредиенты: 999',
+                f'Выберите число большее 0 для ингредиентов: {ingredient.pk}',
+            ],
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+
+def encode_image(image_format='PNG', size=(640, 480)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, image_format)
+    return (
+        f'data:image/{image_format.lower()};base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class RecipeImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def decode(self, data):
+        return RecipeImageField().to_internal_value(data)
+
+    def test_decode(self):
+        for image_format, extension in (('PNG', 'png'), ('JPEG', 'jpg')):
+            with self.subTest(image_format=image_format):
+                file = self.decode(encode_image(image_format))
+                self.assertTrue(file.name.endswith(f'.{extension}'))
+                self.assertEqual(Image.open(file).size, (640, 480))
+
+    def test_invalid_images_are_rejected(self):
+        cases = (
+            ('data:image/png;base64,не base64', {}),
+            (base64.b64encode(b'not an image').decode(), {}),
+            (encode_image('BMP'), {}),
+            (encode_image(), {'RECIPE_IMAGE_MAX_SIZE': 100}),
+            (encode_image(), {'RECIPE_IMAGE_MAX_PIXELS': 640 * 480 - 1}),
+        )
+        for data, limits in cases:
+            with self.subTest(data=data[:30], limits=limits):
+                with override_settings(**limits):
+                    with self.assertRaises(ValidationError):
+                        self.decode(data)
+
+    @override_settings(RECIPE_IMAGE_VARIANTS_ASYNC=False)
+    def test_variants_are_created(self):
+        client = APIClient()
+        client.force_authenticate(create_user())
+        response = client.post(
+            '/api/recipes/',
+            {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 5,
+                'image': encode_image(size=(1200, 900)),
+                'tags': [
+                    Tag.objects.create(
+                        name='Завтрак', slug='breakfast', color=Tag.ORANGE
+                    ).pk
+                ],
+                'ingredients': [
+                    {
+                        'id': Ingredient.objects.create(
+                            name='Соль', measurement_unit='г'
+                        ).pk,
+                        'amount': 10,
+                    }
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        image = Recipe.objects.get().image
+        root = os.path.splitext(image.path)[0]
+        sizes = {}
+        for variant, suffix in (
+            ('thumbnail', '_thumb.webp'),
+            ('webp', '.webp'),
+        ):
+            with Image.open(root + suffix) as variant_image:
+                self.assertEqual(variant_image.format, 'WEBP')
+                sizes[variant] = variant_image.size
+        self.assertEqual(
+            sizes, {'thumbnail': (480, 360), 'webp': (1200, 900)}
+        )
+        recipe = client.get(f'/api/recipes/{response.data["id"]}/').data
+        self.assertEqual(
+            recipe['image_variants'],
+            {
+                'thumbnail': 'http://testserver'
+                + os.path.splitext(image.url)[0] + '_thumb.webp',
+                'webp': 'http://testserver'
+                + os.path.splitext(image.url)[0] + '.webp',
+            },
+        )
+
+
+class RecipeIngredientsUpdateTests(TestCase):
+    """Изменение ингредиентов рецепта затрагивает только разницу."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        (cls.recipe,) = create_recipes(cls.user, 1)
+        add_ingredients(cls.recipe, (100, 5, 1))
+        cls.new = Ingredient.objects.create(
+            name='Ингредиент 3', measurement_unit='г'
+        )
+        ShoppingCart.objects.create(
+            shoppingcart_user=cls.user, shoppingcart_recipe=cls.recipe
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_rows(self):
+        return {
+            item.ingredient.name: (item.pk, item.amount)
+            for item in IngredientRecipe.objects.filter(
+                recipe=self.recipe
+            ).select_related('ingredient')
+        }
+
+    def patch_ingredients(self):
+        ingredients = Ingredient.objects.in_bulk(field_name='name')
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {
+                'ingredients': [
+                    {'id': ingredients[name].pk, 'amount': amount}
+                    for name, amount in (
+                        ('Ингредиент 0', 100),
+                        ('Ингредиент 1', 10),
+                        ('Ингредиент 3', 3),
+                    )
+                ]
+            },
+            format='json',
+        )
+
+    def test_only_changed_rows_are_written(self):
+        before = self.get_rows()
+        response = self.patch_ingredients()
+        self.assertEqual(response.status_code, 200)
+        after = self.get_rows()
+        self.assertEqual(
+            {name: amount for name, (_, amount) in after.items()},
+            {'Ингредиент 0': 100, 'Ингредиент 1': 10, 'Ингредиент 3': 3},
+        )
+        for name in ('Ингредиент 0', 'Ингредиент 1'):
+            self.assertEqual(after[name][0], before[name][0])
+        self.assertEqual(shopping_list.find_inconsistencies(), {})
+        self.assertEqual(
+            dict(
+                ShoppingListItem.objects.filter(user=self.user).values_list(
+                    'ingredient__name', 'total_amount'
+                )
+            ),
+            {'Ингредиент 0': 100, 'Ингредиент 1': 10, 'Ингредиент 3': 3},
+        )
+
+    def test_failed_update_is_rolled_back(self):
+        before = self.get_rows()
+        with mock.patch.object(
+            shopping_list,
+            'update_recipe_ingredients',
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                self.patch_ingredients()
+        self.assertEqual(self.get_rows(), before)
+        self.assertEqual(shopping_list.find_inconsistencies(), {})
+
+
+class BulkRelationViewTests(TestCase):
+    relations = (
+        ('/api/recipes/favorite/', Favorite, 'favorited_user', 'favorites_count'),
+        (
+            '/api/recipes/shopping_cart/',
+            ShoppingCart,
+            'shoppingcart_user',
+            'in_carts_count',
+        ),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.recipes = create_recipes(create_user(1), 3)
+        for recipe in cls.recipes:
+            add_ingredients(recipe, (100, 5))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, url, recipe_ids):
+        response = getattr(self.client, method)(
+            url, {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (item['id'], item['status']) for item in response.data['results']
+        ]
+
+    def get_counters(self, counter_field):
+        return list(
+            Recipe.objects.order_by('id').values_list(counter_field, flat=True)
+        )
+
+    def test_add(self):
+        first, second, _ = (recipe.pk for recipe in self.recipes)
+        for url, model, user_field, counter_field in self.relations:
+            with self.subTest(url=url):
+                self.send('post', url, [first])
+                self.assertEqual(
+                    self.send('post', url, [first, second, 999, second]),
+                    [(first, 'exists'), (second, 'created'), (999, 'not_found')],
+                )
+                self.assertEqual(
+                    model.objects.filter(**{user_field: self.user}).count(), 2
+                )
+                self.assertEqual(self.get_counters(counter_field), [1, 1, 0])
+
+    def test_remove(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        for url, model, user_field, counter_field in self.relations:
+            with self.subTest(url=url):
+                self.send('post', url, [first, second])
+                self.assertEqual(
+                    self.send('delete', url, [first, third, 999]),
+                    [(first, 'deleted'), (third, 'not_found'), (999, 'not_found')],
+                )
+                self.assertEqual(
+                    model.objects.filter(**{user_field: self.user}).count(), 1
+                )
+                self.assertEqual(self.get_counters(counter_field), [0, 1, 0])
+
+    def test_shopping_list_follows_cart(self):
+        url = '/api/recipes/shopping_cart/'
+        self.send('post', url, [recipe.pk for recipe in self.recipes])
+        self.send('delete', url, [self.recipes[0].pk])
+        self.assertEqual(shopping_list.find_inconsistencies([self.user.pk]), {})
+        self.assertEqual(
+            sorted(
+                ShoppingListItem.objects.filter(user=self.user).values_list(
+                    'total_amount', flat=True
+                )
+            ),
+            [10, 200],
+        )
+
+    def count_remove_queries(self, url, table, recipe_ids):
+        self.send('post', url, [recipe.pk for recipe in self.recipes])
+        with CaptureQueriesContext(connection) as context:
+            self.send('delete', url, recipe_ids)
+        return len(context.captured_queries), [
+            query['sql'].split(' ', 1)[0]
+            for query in context.captured_queries
+            if f'FROM "{table}"' in query['sql']
+        ]
+
+    def test_remove_does_not_load_rows(self):
+        recipe_ids = [recipe.pk for recipe in self.recipes]
+        for url, model, _, _ in self.relations:
+            with self.subTest(url=url):
+                table = model._meta.db_table
+                one, statements = self.count_remove_queries(
+                    url, table, recipe_ids[:1]
+                )
+                self.assertEqual(statements, ['SELECT', 'DELETE'])
+                self.assertEqual(
+                    self.count_remove_queries(url, table, recipe_ids[:2]),
+                    (one, statements),
+                )
+                self.assertEqual(model.objects.count(), 1)
+
+
+class ShoppingListTests(BulkShoppingCartMixin, TestCase):
+    def setUp(self):
+        self.create_data()
+        IngredientRecipe.objects.filter(amount=100).update(amount=625)
+        self.post_recipes()
+
+    def test_list_matches_download(self):
+        client = self.get_client()
+        items = client.get('/api/recipes/shopping_list/').json()
+        download = client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        ).json()
+        self.assertEqual(
+            {item['name']: item['total_amount'] for item in items},
+            {'Ингредиент 0': 1.25, 'Ингредиент 1': 10},
+        )
+        self.assertEqual(
+            sorted(
+                (item['name'], item['measurement_unit'], item['total_amount'])
+                for item in items
+            ),
+            sorted(
+                (item['name'], item['measurement_unit'], item['total_amount'])
+                for item in download
+            ),
+        )
+
+
+class ShoppingCartJobTests(BulkShoppingCartMixin, TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.create_data()
+        self.post_recipes()
+        self.client = self.get_client()
+
+    def create_job(self, format='txt'):
+        response = self.client.post(
+            '/api/jobs/shopping_cart/', {'format': format}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def test_create(self):
+        data = self.create_job()
+        self.assertEqual(
+            (data['task'], data['status'], data['download']),
+            ('render_shoppingcart', Job.PENDING, None),
+        )
+        job = Job.objects.get(pk=data['id'])
+        self.assertEqual((job.user, job.kwargs), (self.user, {'format': 'txt'}))
+
+    def test_create_unknown_format(self):
+        response = self.client.post(
+            '/api/jobs/shopping_cart/', {'format': 'docx'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_jobs_of_other_users_are_hidden(self):
+        own = self.create_job()
+        other = Job.objects.create(
+            task='render_shoppingcart', user=create_user(1)
+        )
+        response = self.client.get('/api/jobs/')
+        self.assertEqual(
+            [job['id'] for job in response.data['results']], [own['id']]
+        )
+        for url in (f'/api/jobs/{other.pk}/', f'/api/jobs/{other.pk}/download/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_download_after_job_is_done(self):
+        data = self.create_job()
+        url = f'/api/jobs/{data["id"]}/download/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        claim_jobs(1)
+        self.assertEqual(run_job(data['id']), Job.DONE)
+        data = self.client.get(f'/api/jobs/{data["id"]}/').data
+        self.assertEqual(data['status'], Job.DONE)
+        self.assertTrue(data['download'].endswith(url))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'Ингредиент 1 - 10 г\nИнгредиент 0 - 200 г\n',
+        )
+
+
+class ShoppingCartDownloadTests(TestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index}', measurement_unit='шт')
+            for index in range(120)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {index}',
+                author=cls.user,
+                text='Описание',
+                cooking_time=5,
+                image='media/recipe.png',
+            )
+            for index in range(500)
+        )
+        ingredients = list(Ingredient.objects.all())
+        recipes = list(Recipe.objects.all())
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient=ingredients[(index + shift) % len(ingredients)],
+                amount=1,
+            )
+            for index, recipe in enumerate(recipes)
+            for shift in range(3)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(shoppingcart_user=cls.user, shoppingcart_recipe=recipe)
+            for recipe in recipes
+        )
+        shopping_list.rebuild([cls.user.pk])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_large_cart_pdf(self):
+        response = self.client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # 120 строк по 13 на страницу.
+        self.assertEqual(len(re.findall(rb'/Type /Page\b(?!s)', pdf)), 10)
+        with mock.patch('api.utils.render_shoppingcart_pdf') as render:
+            response = self.client.get(self.url, {'format': 'pdf'})
+            self.assertEqual(b''.join(response.streaming_content), pdf)
+        render.assert_not_called()
+
+
+@override_settings(SHARED_CACHE=True)
+class RecipeFlagsTests(TestCase):
+    """Флаги избранного и корзины считаются для каждого читателя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.favorite, cls.in_cart, cls.other = create_recipes(
+            create_user(1), 3
+        )
+        Favorite.objects.create(
+            favorited_user=cls.user, favorited_recipe=cls.favorite
+        )
+        ShoppingCart.objects.create(
+            shoppingcart_user=cls.user, shoppingcart_recipe=cls.in_cart
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_flags(self, user=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        flags = {}
+        for recipe in client.get('/api/recipes/').data['results']:
+            detail = client.get(f'/api/recipes/{recipe["id"]}/').data
+            for data in (recipe, detail):
+                self.assertEqual(
+                    (data['is_favorited'], data['is_in_shopping_cart']),
+                    (recipe['is_favorited'], recipe['is_in_shopping_cart']),
+                )
+            flags[recipe['id']] = (
+                recipe['is_favorited'],
+                recipe['is_in_shopping_cart'],
+            )
+        return flags
+
+    def test_flags_of_reader(self):
+        self.assertEqual(
+            self.get_flags(self.user),
+            {
+                self.favorite.pk: (True, False),
+                self.in_cart.pk: (False, True),
+                self.other.pk: (False, False),
+            },
+        )
+
+    def test_flags_come_from_annotations(self):
+        with mock.patch('api.serializers.process_custom_context') as lookup:
+            self.get_flags(self.user)
+        lookup.assert_not_called()
+
+    def test_cached_recipes_do_not_leak_flags(self):
+        self.get_flags(self.user)
+        for user in (None, create_user(2)):
+            with self.subTest(user=user):
+                self.assertEqual(
+                    set(self.get_flags(user).values()), {(False, False)}
+                )
+
+
+@override_settings(SHARED_CACHE=True)
+class RecipeReadQueryTests(TestCase):
+    """Число запросов к базе при чтении рецептов не зависит от их числа."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        authors = [create_user(index) for index in range(1, 4)]
+        tags = [
+            Tag.objects.create(name=name, slug=slug, color=color)
+            for name, slug, color in (
+                ('Завтрак', 'breakfast', Tag.ORANGE),
+                ('Обед', 'lunch', Tag.GREEN),
+            )
+        ]
+        recipes = []
+        for author in authors:
+            recipes += create_recipes(author, 40)
+        for recipe in recipes:
+            recipe.tags.set(tags)
+            add_ingredients(recipe, (100, 5, 1))
+        for recipe in recipes[::2]:
+            Favorite.objects.create(
+                favorited_user=cls.user, favorited_recipe=recipe
+            )
+            ShoppingCart.objects.create(
+                shoppingcart_user=cls.user, shoppingcart_recipe=recipe
+            )
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_queries(self, url, cold, warm):
+        for queries in (cold, warm):
+            with self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_list(self):
+        for limit in (1, 6, 100):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.assert_queries(f'/api/recipes/?limit={limit}', 5, 2)
+
+    def test_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_queries('/api/recipes/?limit=100', 5, 2)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_list_without_shared_cache(self):
+        self.assert_queries('/api/recipes/?limit=100', 5, 5)
+
+    def test_list_page_has_all_recipes(self):
+        response = self.client.get('/api/recipes/?limit=100')
+        self.assertEqual(response.data['count'], 120)
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_detail(self):
+        self.assert_queries(f'/api/recipes/{self.recipe.pk}/', 4, 1)
+
+
+class TagFilterTests(TestCase):
+    """Фильтр по нескольким тегам не размножает рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        breakfast, lunch = (
+            Tag.objects.create(name=name, slug=slug, color=color)
+            for name, slug, color in (
+                ('Завтрак', 'breakfast', Tag.ORANGE),
+                ('Обед', 'lunch', Tag.GREEN),
+            )
+        )
+        cls.recipes = create_recipes(create_user(), 4)
+        for recipe, tags in zip(
+            cls.recipes, ((breakfast,), (lunch,), (breakfast, lunch), ())
+        ):
+            recipe.tags.set(tags)
+
+    def get_ids(self, query):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/recipes/?limit=10&{query}')
+        self.assertEqual(response.status_code, 200)
+        for captured in context.captured_queries:
+            self.assertNotIn('DISTINCT', captured['sql'])
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(response.data['count'], len(ids))
+        return ids
+
+    def test_filter(self):
+        first, second, both, _ = (recipe.pk for recipe in self.recipes)
+        for query, expected in (
+            ('tags=breakfast', [both, first]),
+            ('tags=breakfast&tags=lunch', [both, second, first]),
+            (
+                'tags=breakfast&tags=lunch&tags=breakfast',
+                [both, second, first],
+            ),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(self.get_ids(query), expected)
+
+    def test_unknown_tag(self):
+        response = self.client.get('/api/recipes/?tags=brunch')
+        self.assertEqual(response.status_code, 400)
+
+
+class SubscriptionsFeedTests(TestCase):
+    """Лента подписок строится за постоянное число запросов."""
+
+    url = '/api/users/subscriptions/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.authors = [create_user(index) for index in range(1, 7)]
+        for count, author in enumerate(cls.authors, 1):
+            create_recipes(author, count)
+            Subscription.objects.create(
+                subscriber=cls.user, subscribed_to=author
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_feed(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for limit in (1, 3, 6):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(6):
+                    self.get_feed(limit=limit, recipes_limit=2)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_cached_recipes_are_not_prefetched(self):
+        for queries in (6, 4):
+            with self.assertNumQueries(queries):
+                self.get_feed(limit=6, recipes_limit=2)
+
+    def test_recipes_count_and_limit(self):
+        feed = self.get_feed(limit=6, recipes_limit=2)
+        self.assertEqual(
+            [author['id'] for author in feed],
+            [author.pk for author in reversed(self.authors)],
+        )
+        for author in feed:
+            with self.subTest(author=author['username']):
+                recipes = Recipe.objects.filter(author_id=author['id'])
+                self.assertEqual(author['recipes_count'], recipes.count())
+                self.assertTrue(author['is_subscribed'])
+                self.assertEqual(
+                    [recipe['id'] for recipe in author['recipes']],
+                    list(
+                        recipes.order_by('-id').values_list(
+                            'id', flat=True
+                        )[:2]
+                    ),
+                )
+
+    def test_invalid_recipes_limit_is_ignored(self):
+        feed = self.get_feed(limit=6, recipes_limit='abc')
+        self.assertEqual(
+            [len(author['recipes']) for author in feed],
+            [6, 5, 4, 3, 2, 1],
+        )
+
+
+class FakeDataBenchmarkTests(TestCase):
+    """Синтетические данные и прогон benchmark на них."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        call_command(
+            'generate_fake_data',
+            users=10,
+            recipes=30,
+            seed=1,
+            stdout=io.StringIO(),
+        )
+
+    def test_generated_data_is_consistent(self):
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertFalse(
+            Recipe.objects.filter(ingredients__isnull=True).exists()
+        )
+        self.assertFalse(Recipe.objects.filter(tags__isnull=True).exists())
+        counters = Recipe.objects.annotate(
+            favorites=Count('favorited_recipe', distinct=True),
+            carts=Count('shoppingcart_recipe', distinct=True),
+        )
+        for recipe in counters:
+            self.assertEqual(
+                (recipe.favorites_count, recipe.in_carts_count),
+                (recipe.favorites, recipe.carts),
+            )
+        self.assertEqual(shopping_list.find_inconsistencies(), {})
+
+    def test_benchmark_leaves_data_unchanged(self):
+        output = os.path.join(self.media_root, 'benchmark.json')
+        scenarios = (
+            'recipes_list',
+            'subscriptions',
+            'recipe_create_5',
+            'shopping_cart_csv_5',
+        )
+        recipes = set(Recipe.objects.values_list('id', 'in_carts_count'))
+        with mock.patch(
+            'api.management.commands.benchmark.setup_test_environment'
+        ):
+            call_command(
+                'benchmark',
+                repeat=1,
+                warmup=0,
+                only=scenarios,
+                output=output,
+                stdout=io.StringIO(),
+            )
+        with open(output, encoding='utf-8') as file:
+            report = json.load(file)
+        self.assertEqual(list(report['results']), list(scenarios))
+        for result in report['results'].values():
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['size'], 0)
+        self.assertEqual(
+            set(Recipe.objects.values_list('id', 'in_carts_count')), recipes
+        )
+        self.assertEqual(User.objects.count(), 10)
+
+
+@override_settings(DB_CONN_HEALTH_CHECKS=True, DB_STATS_LOG_EVERY=3)
+class ConnectionHealthCheckTests(TestCase):
+    """Постоянные соединения проверяются в начале каждого запроса."""
+
+    def setUp(self):
+        stats = mock.patch.dict(db.stats, {'requests': 0, 'connections': 0})
+        stats.start()
+        self.addCleanup(stats.stop)
+
+    def create_connection(self, usable=True, opened=True, atomic=False):
+        return mock.Mock(
+            connection=object() if opened else None,
+            in_atomic_block=atomic,
+            **{'is_usable.return_value': usable},
+        )
+
+    def check_connections(self, *database_connections):
+        with mock.patch.object(db, 'connections') as connections:
+            connections.all.return_value = database_connections
+            db.check_connections(sender=None)
+
+    def test_broken_connection_is_closed(self):
+        broken = self.create_connection(usable=False)
+        usable = self.create_connection()
+        self.check_connections(broken, usable)
+        broken.close.assert_called_once_with()
+        usable.close.assert_not_called()
+
+    def test_unchecked_connections(self):
+        closed = self.create_connection(usable=False, opened=False)
+        atomic = self.create_connection(usable=False, atomic=True)
+        self.check_connections(closed, atomic)
+        for database_connection in (closed, atomic):
+            database_connection.is_usable.assert_not_called()
+            database_connection.close.assert_not_called()
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=False)
+    def test_health_checks_can_be_disabled(self):
+        broken = self.create_connection(usable=False)
+        self.check_connections(broken)
+        broken.close.assert_not_called()
+
+    def test_reuse_rate_is_logged(self):
+        db.count_connection(sender=None, connection=None)
+        client = APIClient()
+        with self.assertLogs('foodgram.db', 'INFO') as logs:
+            for _ in range(3):
+                client.get('/api/tags/')
+        self.assertEqual(
+            db.get_connection_stats(),
+            {'requests': 3, 'connections': 1, 'reuse_rate': 1 - 1 / 3},
+        )
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('доля переиспользования: 0.67', logs.output[0])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Нужен EXPLAIN PostgreSQL')
+class QueryPlanTests(TestCase):
+    """Горячие запросы API используют индексы, а не полный просмотр.
+
+    На тестовых объёмах планировщик выбрал бы Seq Scan при любых
+    индексах, поэтому полный просмотр запрещается на время теста:
+    он остаётся в плане, только если подходящего индекса нет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color=Tag.ORANGE
+        )
+        for index in range(1, 4):
+            author = create_user(index)
+            Subscription.objects.create(
+                subscriber=cls.user, subscribed_to=author
+            )
+            for recipe in create_recipes(author, 3):
+                recipe.tags.add(tag)
+                add_ingredients(recipe, (100, 5))
+                Favorite.objects.create(
+                    favorited_user=cls.user, favorited_recipe=recipe
+                )
+                ShoppingCart.objects.create(
+                    shoppingcart_user=cls.user, shoppingcart_recipe=recipe
+                )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.queries = get_hot_queries(self.user)
+
+    def test_no_sequential_scans(self):
+        table_sizes = get_table_sizes()
+        for name, queryset in self.queries.items():
+            with self.subTest(query=name):
+                self.assertEqual(
+                    find_sequential_scans(queryset, 0, table_sizes), []
+                )
+
+    def test_access_path_indexes_are_used(self):
+        # Без сортировки обычный индекс внешнего ключа не выигрывает у
+        # составного, который сразу отдаёт строки в порядке -id.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_sort = off')
+        for name, index in (
+            ('recipes_filter_author', 'recipe_author_id_idx'),
+            ('recipes_popular', 'recipe_popular_idx'),
+            ('subscriptions', 'subscription_subscriber_idx'),
+        ):
+            with self.subTest(query=name):
+                self.assertIn(index, self.queries[name].explain())
+
+
+class UnsupportedVendorTests(TestCase):
+    """Планы баз без шаблона Seq Scan не разбираются, а пропускаются."""
+
+    def test_find_sequential_scans_is_empty(self):
+        queryset = Recipe.objects.all()
+        with mock.patch('foodgram.explain.connections') as connections:
+            connections.__getitem__.return_value.vendor = 'oracle'
+            self.assertEqual(find_sequential_scans(queryset), [])
+
+    def test_check_query_plans_is_skipped(self):
+        stdout = io.StringIO()
+        with mock.patch(
+            'api.management.commands.check_query_plans.connection'
+        ) as database_connection:
+            database_connection.vendor = 'oracle'
+            call_command('check_query_plans', stdout=stdout)
+        self.assertIn('проверка пропущена', stdout.getvalue())
+
+
+class ShoppingCartRendererTests(TestCase):
+    def test_stream_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ShoppingCartRenderer()
+
+        class ItemsRenderer(ShoppingCartRenderer):
+            def stream(self, data):
+                yield from data
+
+        self.assertEqual(ItemsRenderer().render(['а', 'б']), 'аб'.encode())
+
+
+class SharedCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.recipe,) = create_recipes(create_user(), 1)
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_process_local_cache_is_not_used(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIsNone(cache.get(RECIPE_KEY.format(self.recipe.pk)))
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache_is_used(self):
+        response = self.client.get(self.url)
+        self.assertIsNotNone(cache.get(RECIPE_KEY.format(self.recipe.pk)))
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        for index, recipe in enumerate(create_recipes(cls.user, 9)):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=index % 3
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_all_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_popular_ordering_falls_back_to_pages(self):
+        expected = list(
+            Recipe.objects.order_by('-favorites_count', '-id').values_list(
+                'id', flat=True
+            )
+        )
+        url = '/api/recipes/?ordering=popular&cursor=&limit=2'
+        self.assertEqual(self.client.get(url).data['count'], 9)
+        self.assertEqual(self.get_all_pages(url), expected)
+
+    def test_cursor_default_ordering(self):
+        expected = list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)
+        )
+        self.assertEqual(
+            self.get_all_pages('/api/recipes/?cursor=&limit=2'), expected
+        )
+
+    def test_cursor_ignores_counter_changes(self):
+        expected = list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)
+        )
+        response = self.client.get('/api/recipes/?cursor=&limit=2')
+        self.assertNotIn('count', response.data)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        Recipe.objects.filter(pk=expected[-1]).update(favorites_count=100)
+        self.assertEqual(
+            ids + self.get_all_pages(response.data['next']), expected
+        )
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(BulkShoppingCartMixin, TestCase):
+    def setUp(self):
+        self.create_data()
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+    def test_serialization_time_is_recorded(self):
+        response = APIClient().get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        stats = registry.snapshot()['RecipeViewSet.list']
+        self.assertEqual(stats['count'], 1)
+        self.assertGreater(stats['sums']['serialization_time'], 0)
+        self.assertGreater(stats['sums']['render_time'], 0)
+        self.assertLess(
+            stats['sums']['serialization_time'], stats['sums']['duration']
+        )
+        self.assertIs(
+            BaseSerializer.__dict__['data'], serializer_profiler.original
+        )
+
+    def test_streamed_size_is_recorded(self):
+        client = self.get_client()
+        self.post_recipes(client)
+        response = client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'txt'}
+        )
+        self.assertNotIn('ShoppingCartDownloadView', registry.snapshot())
+        content = b''.join(response.streaming_content)
+        stats = registry.snapshot()['ShoppingCartDownloadView']
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['sums']['size'], len(content))
@@ -3,12 +3,19 @@ from rest_framework.routers import DefaultRouter
 from djoser import views
 
 from api.views import (
+    FavoriteBulkView,
     FavoriteViewSet,
     IngredientViewSet,
+    JobDownloadView,
+    JobViewSet,
     MeViewSet,
+    MetricsView,
     RecipeViewSet,
+    ShoppingCartBulkView,
     ShoppingCartDownloadView,
+    ShoppingCartJobView,
     ShoppingCartViewSet,
+    ShoppingListView,
     SubscriptionsViewSet,
     SubscriptionViewSet,
     TagViewSet,
@@ -29,6 +36,7 @@ router.register(
     ShoppingCartViewSet,
     basename='shoppingcarts',
 )
+router.register('jobs', JobViewSet)
 router.register('users/me', MeViewSet)
 router.register('users/subscriptions', SubscriptionsViewSet)
 router.register('users', UserViewSet)
@@ -46,6 +54,32 @@ urlpatterns = [
         ShoppingCartDownloadView.as_view(),
         name='download_shopping_cart',
     ),
+    path(
+        'recipes/favorite/',
+        FavoriteBulkView.as_view(),
+        name='favorite_bulk',
+    ),
+    path(
+        'recipes/shopping_cart/',
+        ShoppingCartBulkView.as_view(),
+        name='shopping_cart_bulk',
+    ),
+    path(
+        'recipes/shopping_list/',
+        ShoppingListView.as_view({'get': 'list'}),
+        name='shopping_list',
+    ),
+    path(
+        'jobs/shopping_cart/',
+        ShoppingCartJobView.as_view(),
+        name='shopping_cart_job',
+    ),
+    path(
+        'jobs/<uuid:pk>/download/',
+        JobDownloadView.as_view(),
+        name='job_download',
+    ),
+    path('_metrics/', MetricsView.as_view(), name='metrics'),
     path(
         'users/set_password/',
         views.UserViewSet.as_view({"post": "set_password"}),
@@ -1,12 +1,39 @@
-import re
+import hashlib
+import io
+from collections import Counter
 
 from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value,
+)
 from django.shortcuts import get_object_or_404
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
 from rest_framework import status
 from rest_framework.response import Response
 
-from recipes.models import IngredientRecipe
-from users.models import User
+from foodgram.versions import bump_version
+from recipes import shopping_list
+from recipes.models import (
+    Favorite,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+)
+from recipes.quantities import aggregate_quantities
+from recipes.signals import VERSIONED_MODELS
+from users.models import Subscription, User
 
 
 def process_custom_context(
@@ -32,36 +59,173 @@ def get_model_instance(app_name, model_name):
     return apps.get_model(f"{app_name}.{model_name}")
 
 
-def process_recipe_ingredients_data(self, instance):
-    context = self.context['request']
-    ingredients = context.data['ingredients']
-    recipes_ingredients_bulk_create = []
-    for ingredient in ingredients:
-        ingredient_for_recipe_id = ingredient['id']
-        amount_for_recipe = ingredient['amount']
-        amount_for_recipe = re.sub("[^0-9]", "", amount_for_recipe)
-        recipes_ingredients_bulk_create.append(
-            IngredientRecipe(
-                recipe=instance,
-                amount=amount_for_recipe,
-                ingredient_id=ingredient_for_recipe_id,
+RECIPE_READ_PREFETCHES = (
+    'author',
+    'tags',
+    Prefetch(
+        'RecipeIngredients',
+        queryset=IngredientRecipe.objects.select_related('ingredient'),
+    ),
+)
+
+
+def annotate_recipe_flags(queryset, user):
+    if user.is_anonymous:
+        return queryset.annotate(
+            is_favorited=Value(False, output_field=BooleanField()),
+            is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            author_is_subscribed=Value(False, output_field=BooleanField()),
+        )
+    return queryset.annotate(
+        is_favorited=Exists(
+            Favorite.objects.filter(
+                favorited_user=user, favorited_recipe=OuterRef('pk')
             )
+        ),
+        is_in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(
+                shoppingcart_user=user, shoppingcart_recipe=OuterRef('pk')
+            )
+        ),
+        author_is_subscribed=Exists(
+            Subscription.objects.filter(
+                subscriber=user, subscribed_to=OuterRef('author')
+            )
+        ),
+    )
+
+
+def get_feed_recipes_queryset(user, recipes_limit=None):
+    """Рецепты авторов для ленты подписок.
+
+    При заданном recipes_limit у каждого автора берутся только его
+    последние recipes_limit рецептов.
+    """
+    recipes = annotate_recipe_flags(Recipe.objects.all(), user)
+    if recipes_limit is not None:
+        recipes = recipes.filter(
+            pk__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author')).values(
+                    'pk'
+                )[:recipes_limit]
+            )
+        )
+    return recipes
+
+
+def get_subscriptions_queryset(user, recipes_limit=None):
+    """Подписки пользователя с авторами и их последними рецептами.
+
+    Число рецептов автора аннотируется, а сами рецепты подгружаются
+    одним запросом на всю страницу.
+    """
+    return (
+        Subscription.objects.filter(subscriber=user)
+        .order_by('-id')
+        .prefetch_related(
+            Prefetch(
+                'subscribed_to',
+                queryset=User.objects.annotate(
+                    recipes_count=Count('recipes'),
+                    is_subscribed=Value(True, output_field=BooleanField()),
+                ),
+            ),
+            Prefetch(
+                'subscribed_to__recipes',
+                queryset=get_feed_recipes_queryset(user, recipes_limit),
+                to_attr='feed_recipes',
+            ),
         )
-    IngredientRecipe.objects.bulk_create(recipes_ingredients_bulk_create)
+    )
+
+
+def get_duplicates(values):
+    return sorted(
+        value for value, count in Counter(values).items() if count > 1
+    )
+
+
+def format_ids(ids):
+    return ', '.join(map(str, ids))
+
+
+def process_recipe_ingredients_data(instance, ingredients, created=False):
+    """Приводит ингредиенты рецепта к ingredients: {ingredient_id: amount}.
+
+    Существующие строки IngredientRecipe сравниваются с новыми: новые
+    вставляются одним bulk_create, изменённые количества обновляются
+    одним bulk_update, лишние удаляются одним delete. Неизменённые
+    строки не трогаются, а разница переносится в списки покупок
+    пользователей, у которых рецепт в корзине. Вызывать внутри
+    transaction.atomic.
+    """
+    existing = {}
+    if not created:
+        existing = {
+            item.ingredient_id: item
+            for item in IngredientRecipe.objects.filter(
+                recipe=instance
+            ).only('id', 'ingredient_id', 'amount')
+        }
+    to_create = [
+        IngredientRecipe(
+            recipe=instance, ingredient_id=ingredient_id, amount=amount
+        )
+        for ingredient_id, amount in ingredients.items()
+        if ingredient_id not in existing
+    ]
+    to_update = []
+    to_delete = []
+    deltas = {
+        item.ingredient_id: item.amount for item in to_create
+    }
+    for ingredient_id, item in existing.items():
+        if ingredient_id not in ingredients:
+            to_delete.append(item.pk)
+            deltas[ingredient_id] = -item.amount
+        elif item.amount != ingredients[ingredient_id]:
+            deltas[ingredient_id] = ingredients[ingredient_id] - item.amount
+            item.amount = ingredients[ingredient_id]
+            to_update.append(item)
+    if to_delete:
+        IngredientRecipe.objects.filter(pk__in=to_delete).delete()
+    if to_create:
+        IngredientRecipe.objects.bulk_create(to_create)
+    if to_update:
+        IngredientRecipe.objects.bulk_update(to_update, ['amount'])
+    if not created:
+        shopping_list.update_recipe_ingredients(instance.pk, deltas)
+
+
+def update_counter(model, pk, counter_field, delta):
+    model.objects.filter(pk=pk).update(
+        **{counter_field: F(counter_field) + delta}
+    )
 
 
 def process_perform_create(
-    self, serializer, model, modelfield_first, modelfield_second
+    self,
+    serializer,
+    model,
+    modelfield_first,
+    modelfield_second,
+    counter_field=None,
 ):
     modelfield_second_value = get_object_or_404(
         model, id=self.kwargs.get("recipe_id")
     )
-    serializer.save(
-        **{
-            modelfield_first: self.request.user,
-            modelfield_second: modelfield_second_value,
-        }
-    )
+    with transaction.atomic():
+        shopping_list.lock_users([self.request.user.pk])
+        serializer.save(
+            **{
+                modelfield_first: self.request.user,
+                modelfield_second: modelfield_second_value,
+            }
+        )
+        if counter_field:
+            update_counter(
+                model, modelfield_second_value.pk, counter_field, 1
+            )
 
 
 def process_delete(
@@ -70,19 +234,204 @@ def process_delete(
     model_for_deletion,
     modelfield_first,
     modelfield_second,
+    counter_field=None,
 ):
     modelfield_second_value = get_object_or_404(
         model_first_field, id=self.kwargs.get("recipe_id")
     )
-    instance_for_deletion = get_object_or_404(
-        model_for_deletion,
-        **{
-            modelfield_first: self.request.user,
-            modelfield_second: modelfield_second_value,
-        },
-    )
-    instance_for_deletion.delete()
+    with transaction.atomic():
+        shopping_list.lock_users([self.request.user.pk])
+        instance_for_deletion = get_object_or_404(
+            model_for_deletion,
+            **{
+                modelfield_first: self.request.user,
+                modelfield_second: modelfield_second_value,
+            },
+        )
+        instance_for_deletion.delete()
+        if counter_field:
+            update_counter(
+                model_first_field,
+                modelfield_second_value.pk,
+                counter_field,
+                -1,
+            )
     return Response(
         {'success': 'Рецепт успешно удален из избранного.'},
         status=status.HTTP_204_NO_CONTENT,
     )
+
+
+def update_counters(model, pks, counter_field, delta):
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{counter_field: F(counter_field) + delta}
+        )
+
+
+def process_bulk_create(
+    self,
+    recipe_ids,
+    model,
+    model_for_creation,
+    modelfield_first,
+    modelfield_second,
+    counter_field=None,
+):
+    """Добавляет пачку рецептов в избранное или корзину пользователя.
+
+    Возвращает статус по каждому id: created, exists или not_found.
+    Строки вставляются одним bulk_create, счётчики рецептов
+    обновляются одним UPDATE. Строка пользователя блокируется до
+    проверки существующих связей: без этого параллельный запрос вставил
+    бы те же строки, bulk_create молча пропустил бы их, а счётчики и
+    список покупок увеличились бы дважды.
+    """
+    user = self.request.user
+    with transaction.atomic():
+        shopping_list.lock_users([user.pk])
+        found = set(
+            model.objects.filter(id__in=recipe_ids).values_list(
+                'id', flat=True
+            )
+        )
+        existing = set(
+            model_for_creation.objects.filter(
+                **{
+                    modelfield_first: user,
+                    f'{modelfield_second}__in': found,
+                }
+            ).values_list(f'{modelfield_second}_id', flat=True)
+        )
+        created = found - existing
+        model_for_creation.objects.bulk_create(
+            [
+                model_for_creation(
+                    **{
+                        modelfield_first: user,
+                        f'{modelfield_second}_id': recipe_id,
+                    }
+                )
+                for recipe_id in created
+            ],
+            ignore_conflicts=True,
+        )
+        if counter_field:
+            update_counters(model, created, counter_field, 1)
+        if model_for_creation is ShoppingCart:
+            shopping_list.add_recipes(user.pk, created)
+    if created:
+        bump_version(VERSIONED_MODELS[model_for_creation])
+    statuses = {recipe_id: 'exists' for recipe_id in existing}
+    statuses.update({recipe_id: 'created' for recipe_id in created})
+    return get_bulk_response(recipe_ids, statuses)
+
+
+def process_bulk_delete(
+    self,
+    recipe_ids,
+    model,
+    model_for_deletion,
+    modelfield_first,
+    modelfield_second,
+    counter_field=None,
+):
+    """Убирает пачку рецептов из избранного или корзины пользователя.
+
+    Возвращает статус по каждому id: deleted или not_found. Строки
+    удаляются одним DELETE в обход сборщика Django: из-за receiver'ов
+    удаления он выбирал бы строки и удалял их по одной. Поэтому то, что
+    делают receiver'ы, здесь вызывается явно, как в process_bulk_create:
+    список покупок уменьшается через remove_recipes, версия таблицы
+    повышается через bump_version.
+    """
+    user = self.request.user
+    queryset = model_for_deletion.objects.filter(
+        **{
+            modelfield_first: user,
+            f'{modelfield_second}__in': recipe_ids,
+        }
+    )
+    with transaction.atomic():
+        shopping_list.lock_users([user.pk])
+        deleted = set(
+            queryset.values_list(
+                f'{modelfield_second}_id', flat=True
+            )
+        )
+        if deleted:
+            if model_for_deletion is ShoppingCart:
+                shopping_list.remove_recipes(user.pk, deleted)
+            rows = queryset.filter(**{f'{modelfield_second}__in': deleted})
+            rows._raw_delete(rows.db)
+        if counter_field:
+            update_counters(model, deleted, counter_field, -1)
+    if deleted:
+        bump_version(VERSIONED_MODELS[model_for_deletion])
+    return get_bulk_response(
+        recipe_ids, {recipe_id: 'deleted' for recipe_id in deleted}
+    )
+
+
+def get_bulk_response(recipe_ids, statuses):
+    return Response(
+        {
+            'results': [
+                {
+                    'id': recipe_id,
+                    'status': statuses.get(recipe_id, 'not_found'),
+                }
+                for recipe_id in dict.fromkeys(recipe_ids)
+            ]
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+def get_shoppingcart_ingredients_queryset(user):
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(
+            'total_amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        )
+        .order_by('total_amount', 'name')
+    )
+
+
+def get_shoppingcart_ingredients(user):
+    return aggregate_quantities(get_shoppingcart_ingredients_queryset(user))
+
+
+def render_shoppingcart_pdf(shoppingcart_ingredients_list):
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer)
+    p.setFont(settings.SHOPPINGCART_FONT, 12)
+    y = 800
+    for line in shoppingcart_ingredients_list:
+        if y < 60:
+            p.showPage()
+            p.setFont(settings.SHOPPINGCART_FONT, 12)
+            y = 800
+        p.drawCentredString(4.25 * inch, y, line)
+        y -= 60
+    p.save()
+    return buffer.getvalue()
+
+
+def get_shoppingcart_pdf(shoppingcart_ingredients_list):
+    """PDF списка покупок из кэша или свежесобранный ReportLab.
+
+    Ключ кэша - хэш итогового списка ингредиентов, поэтому повторная
+    выгрузка неизменившейся корзины не запускает рендеринг.
+    """
+    digest = hashlib.sha256(
+        '\n'.join(shoppingcart_ingredients_list).encode()
+    ).hexdigest()
+    cache_key = f'shoppingcart_pdf:{digest}'
+    pdf = cache.get(cache_key)
+    if pdf is None:
+        pdf = render_shoppingcart_pdf(shoppingcart_ingredients_list)
+        cache.set(cache_key, pdf, settings.SHOPPINGCART_CACHE_TIMEOUT)
+    return pdf
@@ -1,14 +1,14 @@
 import io
+from functools import wraps
 
-from django.db.models import Sum, IntegerField
-from django.db.models.functions import Cast
-from django.http import FileResponse
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status
 from rest_framework.mixins import (
     CreateModelMixin,
@@ -17,7 +17,12 @@ from rest_framework.mixins import (
     RetrieveModelMixin,
     UpdateModelMixin,
 )
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated,
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import (
@@ -26,28 +31,37 @@ from rest_framework.viewsets import (
     ReadOnlyModelViewSet,
 )
 
-from api.pagination import TruncatedListPagination
+from api.pagination import TruncatedFeedPagination
+from api.renderers import PrometheusRenderer, SHOPPINGCART_RENDERERS
 from users.models import Subscription, User
-from foodgram import settings
+from foodgram.db import get_connection_stats
 from foodgram.permission import OwnerOrReadOnly
+from foodgram.profiling import registry
+from foodgram.versions import versions_etag, versions_last_modified
+from jobs.models import Job
+from recipes.cache import get_stats as get_recipe_cache_stats
 from recipes.models import (
     Favorite,
     Ingredient,
-    IngredientRecipe,
     Recipe,
     ShoppingCart,
     Tag,
 )
+from recipes.quantities import aggregate_quantities
 from api.filters import RecipeFilter, IngredientFilter
 from api.serializers import (
     FavoriteDeleteSerializer,
     FavoriteSerializer,
     IngredientSerializer,
+    JobSerializer,
     MeReadSerializer,
     RecipeCreateUpdateSerializer,
+    RecipeIdsSerializer,
     RecipeReadSerializer,
     ShoppingCartDeleteSerializer,
+    ShoppingCartJobSerializer,
     ShoppingCartSerializer,
+    ShoppingListItemSerializer,
     SubscriptionDeleteSerializer,
     SubscriptionSerializer,
     SubscriptionsSerializer,
@@ -55,7 +69,55 @@ from api.serializers import (
     UserCreateSerializer,
     UserReadSerializer,
 )
-from api.utils import process_delete, process_perform_create
+from api.utils import (
+    annotate_recipe_flags,
+    get_shoppingcart_ingredients,
+    get_subscriptions_queryset,
+    process_bulk_create,
+    process_bulk_delete,
+    process_delete,
+    process_perform_create,
+)
+
+
+RECIPE_VERSIONS = (
+    'recipes',
+    'tags',
+    'ingredients',
+    'users',
+    'favorites',
+    'shoppingcarts',
+    'subscriptions',
+)
+
+public_cache = method_decorator(
+    cache_control(public=True, max_age=settings.REFERENCE_CACHE_MAX_AGE)
+)
+
+
+def conditional(names, *etag_parts):
+    """ETag и Last-Modified по версиям таблиц names.
+
+    Версии хранятся в кэше, поэтому без общего кэша (SHARED_CACHE)
+    заголовки не выставляются и ответ всегда полный.
+    """
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=versions_etag(names, *etag_parts),
+            last_modified_func=versions_last_modified(names),
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if settings.SHARED_CACHE:
+                return conditional_view(request, *args, **kwargs)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return method_decorator(decorator)
+
+
+def request_user_id(request, *args, **kwargs):
+    return request.user.pk
 
 
 class TagViewSet(ModelViewSet):
@@ -65,6 +127,16 @@ class TagViewSet(ModelViewSet):
     throttle_scope = None
     pagination_class = None
 
+    @public_cache
+    @conditional(('tags',))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @public_cache
+    @conditional(('tags',))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(ModelViewSet):
     queryset = Ingredient.objects.all()
@@ -75,6 +147,16 @@ class IngredientViewSet(ModelViewSet):
     filter_backends = (IngredientFilter,)
     search_fields = ['^name']
 
+    @public_cache
+    @conditional(('ingredients',))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @public_cache
+    @conditional(('ingredients',))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class RecipeViewSet(
     CreateModelMixin,
@@ -87,10 +169,20 @@ class RecipeViewSet(
     queryset = Recipe.objects.all()
     serializer_class = RecipeReadSerializer
     permission_classes = (OwnerOrReadOnly,)
+    pagination_class = TruncatedFeedPagination
     throttle_scope = None
     filter_backends = (DjangoFilterBackend,)
     filter_class = RecipeFilter
 
+    def get_queryset(self):
+        return annotate_recipe_flags(Recipe.objects.all(), self.request.user)
+
+    @method_decorator(cache_control(private=True, max_age=0))
+    @method_decorator(vary_on_headers('Authorization'))
+    @conditional(RECIPE_VERSIONS, request_user_id)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
@@ -118,6 +210,7 @@ class FavoriteViewSet(CreateModelMixin, DestroyModelMixin, GenericViewSet):
             model=Recipe,
             modelfield_first='favorited_user',
             modelfield_second='favorited_recipe',
+            counter_field='favorites_count',
         )
 
     def delete(self, request, *args, **kwargs):
@@ -127,6 +220,7 @@ class FavoriteViewSet(CreateModelMixin, DestroyModelMixin, GenericViewSet):
             model_for_deletion=Favorite,
             modelfield_first='favorited_user',
             modelfield_second='favorited_recipe',
+            counter_field='favorites_count',
         )
 
 
@@ -151,6 +245,7 @@ class ShoppingCartViewSet(CreateModelMixin, DestroyModelMixin, GenericViewSet):
             model=Recipe,
             modelfield_first='shoppingcart_user',
             modelfield_second='shoppingcart_recipe',
+            counter_field='in_carts_count',
         )
 
     def delete(self, request, *args, **kwargs):
@@ -160,64 +255,149 @@ class ShoppingCartViewSet(CreateModelMixin, DestroyModelMixin, GenericViewSet):
             model_for_deletion=ShoppingCart,
             modelfield_first='shoppingcart_user',
             modelfield_second='shoppingcart_recipe',
+            counter_field='in_carts_count',
         )
 
 
+class RecipeBulkRelationView(APIView):
+    """Пакетное добавление и удаление рецептов: {"recipes": [id, ...]}."""
+
+    permission_classes = (IsAuthenticated,)
+    model_for_relation = None
+    modelfield_first = None
+    modelfield_second = None
+    counter_field = None
+
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def post(self, request):
+        return process_bulk_create(
+            self=self,
+            recipe_ids=self.get_recipe_ids(request),
+            model=Recipe,
+            model_for_creation=self.model_for_relation,
+            modelfield_first=self.modelfield_first,
+            modelfield_second=self.modelfield_second,
+            counter_field=self.counter_field,
+        )
+
+    def delete(self, request):
+        return process_bulk_delete(
+            self=self,
+            recipe_ids=self.get_recipe_ids(request),
+            model=Recipe,
+            model_for_deletion=self.model_for_relation,
+            modelfield_first=self.modelfield_first,
+            modelfield_second=self.modelfield_second,
+            counter_field=self.counter_field,
+        )
+
+
+class FavoriteBulkView(RecipeBulkRelationView):
+    model_for_relation = Favorite
+    modelfield_first = 'favorited_user'
+    modelfield_second = 'favorited_recipe'
+    counter_field = 'favorites_count'
+
+
+class ShoppingCartBulkView(RecipeBulkRelationView):
+    model_for_relation = ShoppingCart
+    modelfield_first = 'shoppingcart_user'
+    modelfield_second = 'shoppingcart_recipe'
+    counter_field = 'in_carts_count'
+
+
+class ShoppingListView(ListModelMixin, GenericViewSet):
+    """Список покупок пользователя, уже просуммированный по ингредиентам.
+
+    Количества проходят через aggregate_quantities, как и в выгрузке
+    download_shopping_cart, поэтому оба эндпоинта показывают одни и те
+    же единицы.
+    """
+
+    serializer_class = ShoppingListItemSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = None
+
+    def get_queryset(self):
+        return (
+            self.request.user.shopping_list.select_related('ingredient')
+            .order_by('ingredient__name')
+        )
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return Response(aggregate_quantities(serializer.data))
+
+
 class ShoppingCartDownloadView(APIView):
     permission_classes = (IsAuthenticated,)
+    renderer_classes = SHOPPINGCART_RENDERERS
 
     def get(self, request, format=None):
         return self.download_shoppingcart(request, request.user)
 
+    def handle_exception(self, exc):
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
     def download_shoppingcart(self, request, user):
-        shoppingcart_ingredients_list = []
-        recipe_ingredient_amount_queryset = (
-            IngredientRecipe.objects.filter(
-                recipe__shoppingcart_recipe__shoppingcart_user=user
+        shoppingcart_ingredients = get_shoppingcart_ingredients(user)
+        renderer = request.accepted_renderer
+        if renderer.format == 'json':
+            return Response(shoppingcart_ingredients)
+        filename = f'cart_list.{renderer.format}'
+        if renderer.format == 'pdf':
+            return FileResponse(
+                io.BytesIO(renderer.render(shoppingcart_ingredients)),
+                as_attachment=True,
+                filename=filename,
             )
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .distinct()
-            .annotate(amounts=Sum(Cast('amount', IntegerField())))
-            .order_by('amounts')
+        response = StreamingHttpResponse(
+            renderer.stream(shoppingcart_ingredients),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
         )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
-        for item in recipe_ingredient_amount_queryset:
-            shoppingcart_ingredients_list.append(
-                f'{item["ingredient__name"]}'
-                f' - {item["amounts"]} {item["ingredient__measurement_unit"]}'
-            )
 
-        pdfmetrics.registerFont(
-            TTFont(
-                'FreeSans',
-                str(settings.BASE_DIR) + '/recipes/static/FreeSans.ttf',
-                'UTF-8',
-            )
+class ShoppingCartJobView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, format=None):
+        serializer = ShoppingCartJobSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class JobViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+    throttle_scope = None
+
+    def get_queryset(self):
+        return self.request.user.jobs.all()
+
+
+class JobDownloadView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk, format=None):
+        job = get_object_or_404(
+            request.user.jobs, pk=pk, status=Job.DONE, result__gt=''
         )
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer)
-        p.setFont("FreeSans", 12)
-
-        y = 800
-        for i in range(0, len(shoppingcart_ingredients_list)):
-            if y < 60:
-                p.showPage()
-                p.setFont("FreeSans", 12)
-                y = 800
-            if i == 0:
-                p.drawCentredString(
-                    4.25 * inch, y, shoppingcart_ingredients_list[i]
-                )
-                y -= 60
-            else:
-                p.drawCentredString(
-                    4.25 * inch, y, shoppingcart_ingredients_list[i]
-                )
-                y -= 60
-        p.save()
-        buffer.seek(0)
         return FileResponse(
-            buffer, as_attachment=True, filename="cart_list.pdf"
+            job.result.open('rb'),
+            as_attachment=True,
+            filename=job.result.name.rsplit('/', 1)[-1],
         )
 
 
@@ -304,8 +484,32 @@ class SubscriptionsViewSet(ReadOnlyModelViewSet):
     queryset = Subscription.objects.all()
     serializer_class = SubscriptionsSerializer
     permission_classes = (IsAuthenticated,)
-    pagination_class = TruncatedListPagination
+    pagination_class = TruncatedFeedPagination
     throttle_scope = None
 
     def get_queryset(self):
-        return Subscription.objects.filter(subscriber=self.request.user)
+        recipes_limit = self.request.query_params.get('recipes_limit', '')
+        return get_subscriptions_queryset(
+            self.request.user,
+            int(recipes_limit) if recipes_limit.isdigit() else None,
+        )
+
+
+class MetricsView(APIView):
+    """Метрики профилирования для администраторов."""
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (JSONRenderer, PrometheusRenderer)
+
+    def get(self, request):
+        return Response(
+            {
+                'endpoints': registry.snapshot(),
+                'db_connections': get_connection_stats(),
+                'recipe_cache': get_recipe_cache_stats(),
+            }
+        )
+
+    def delete(self, request):
+        registry.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,56 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+stats_lock = threading.Lock()
+stats = {'requests': 0, 'connections': 0}
+
+
+def get_connection_stats():
+    with stats_lock:
+        requests, opened = stats['requests'], stats['connections']
+    return {
+        'requests': requests,
+        'connections': opened,
+        'reuse_rate': 1 - opened / requests if requests else 0,
+    }
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    with stats_lock:
+        stats['connections'] += 1
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    """Проверяет постоянные соединения в начале запроса.
+
+    Аналог CONN_HEALTH_CHECKS из Django 4.1: соединение, оборванное
+    базой или пулером между запросами, закрывается и будет открыто
+    заново, вместо ошибки посреди запроса.
+    """
+    if settings.DB_CONN_HEALTH_CHECKS:
+        for connection in connections.all():
+            if (
+                connection.connection is not None
+                and not connection.in_atomic_block
+                and not connection.is_usable()
+            ):
+                connection.close()
+    with stats_lock:
+        stats['requests'] += 1
+        requests = stats['requests']
+    if requests % settings.DB_STATS_LOG_EVERY == 0:
+        logger.info(
+            'Запросов: %(requests)s, открыто соединений: %(connections)s, '
+            'доля переиспользования: %(reuse_rate).2f',
+            get_connection_stats(),
+        )
@@ -0,0 +1,39 @@
+import re
+
+from django.apps import apps
+from django.db import connections
+
+SEQUENTIAL_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)\s*$', re.MULTILINE),
+}
+
+
+def get_table_sizes(using='default'):
+    models = apps.get_models(include_auto_created=True)
+    return {
+        model._meta.db_table: model._default_manager.using(using).count()
+        for model in models
+        if model._meta.managed and not model._meta.proxy
+    }
+
+
+def find_sequential_scans(queryset, min_rows=0, table_sizes=None):
+    """Таблицы, которые план запроса читает целиком, без индекса.
+
+    Таблицы меньше min_rows строк пропускаются: на маленьких таблицах
+    планировщик PostgreSQL предпочитает полный просмотр, и это
+    нормально. Псевдонимы подзапросов (U0 и т.п.) считаются большими.
+    Для баз, план которых не разбирается, возвращается пустой список.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor not in SEQUENTIAL_SCAN_PATTERNS:
+        return []
+    if table_sizes is None:
+        table_sizes = get_table_sizes(queryset.db)
+    plan = queryset.explain()
+    return sorted(
+        table
+        for table in set(SEQUENTIAL_SCAN_PATTERNS[vendor].findall(plan))
+        if table_sizes.get(table, min_rows) >= min_rows
+    )
@@ -0,0 +1,269 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLE_FIELDS = (
+    'duration',
+    'queries',
+    'sql_time',
+    'serialization_time',
+    'render_time',
+    'size',
+)
+
+
+class EndpointStats:
+    """Статистика одного эндпоинта.
+
+    Счётчики и гистограмма длительности накапливаются за всё время
+    жизни процесса, квантили считаются по скользящему окну последних
+    PROFILING_WINDOW запросов.
+    """
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sums = dict.fromkeys(SAMPLE_FIELDS, 0)
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+    def add(self, sample):
+        self.samples.append(sample)
+        self.count += 1
+        for field in SAMPLE_FIELDS:
+            self.sums[field] += sample[field]
+        index = bisect.bisect_left(DURATION_BUCKETS, sample['duration'])
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+
+    def quantiles(self, field):
+        values = sorted(sample[field] for sample in self.samples)
+        if not values:
+            return dict.fromkeys(QUANTILES, 0)
+        return {
+            quantile: values[min(int(quantile * len(values)), len(values) - 1)]
+            for quantile in QUANTILES
+        }
+
+    def snapshot(self):
+        window = len(self.samples) or 1
+        return {
+            'count': self.count,
+            'window': len(self.samples),
+            'max_queries': max(
+                (sample['queries'] for sample in self.samples), default=0
+            ),
+            'mean': {
+                field: sum(sample[field] for sample in self.samples) / window
+                for field in SAMPLE_FIELDS
+            },
+            'quantiles': {
+                field: self.quantiles(field) for field in SAMPLE_FIELDS
+            },
+            'sums': dict(self.sums),
+            'buckets': dict(zip(DURATION_BUCKETS, self.buckets)),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(
+            lambda: EndpointStats(settings.PROFILING_WINDOW)
+        )
+
+    def add(self, endpoint, sample):
+        with self.lock:
+            self.endpoints[endpoint].add(sample)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                endpoint: stats.snapshot()
+                for endpoint, stats in sorted(self.endpoints.items())
+            }
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+
+
+registry = MetricsRegistry()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+
+class SerializationTimer:
+    def __init__(self):
+        self.elapsed = 0
+        self.depth = 0
+
+
+serialization_timer = contextvars.ContextVar(
+    'serialization_timer', default=None
+)
+
+
+class SerializerProfiler:
+    """Замеряет время BaseSerializer.data профилируемых запросов.
+
+    Через .data проходит построение представления любого сериализатора
+    DRF. Учитывается только внешний вызов: вложенные .data, например в
+    SerializerMethodField, уже входят в его время. В замер попадают и
+    SQL-запросы, которые сериализатор выполняет при обходе выборки.
+
+    Свойство .data подменяется, только пока выполняется хотя бы один
+    профилируемый запрос, и восстанавливается после последнего.
+    Запросы других потоков в это время проходят через подмену без
+    замера: таймер берётся из contextvar своего запроса.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.original = BaseSerializer.data
+
+    def profiled_data(self, serializer):
+        timer = serialization_timer.get()
+        if timer is None or timer.depth:
+            return self.original.fget(serializer)
+        timer.depth += 1
+        start = time.perf_counter()
+        try:
+            return self.original.fget(serializer)
+        finally:
+            timer.depth -= 1
+            timer.elapsed += time.perf_counter() - start
+
+    @contextmanager
+    def profile(self, timer):
+        with self.lock:
+            if not self.active:
+                BaseSerializer.data = property(self.profiled_data)
+            self.active += 1
+        token = serialization_timer.set(timer)
+        try:
+            yield timer
+        finally:
+            serialization_timer.reset(token)
+            with self.lock:
+                self.active -= 1
+                if not self.active:
+                    BaseSerializer.data = self.original
+
+
+serializer_profiler = SerializerProfiler()
+
+
+def get_endpoint_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None)
+    if actions and request.method.lower() in actions:
+        return f'{view_class.__name__}.{actions[request.method.lower()]}'
+    return view_class.__name__
+
+
+class ProfilingMiddleware:
+    """Профилирование запросов к API.
+
+    Для каждого распознанного представления записывает количество
+    SQL-запросов, время в базе, время построения данных сериализаторами,
+    время рендеринга ответа рендерером и размер ответа. Размер
+    потокового ответа считается по отданным частям, и замер
+    записывается, когда поток закончился.
+    Подключается настройкой PROFILING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profiling_render_time = 0
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            timer = stack.enter_context(
+                serializer_profiler.profile(SerializationTimer())
+            )
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        endpoint = getattr(request, 'profiling_endpoint', None)
+        if endpoint is None:
+            return response
+        sample = {
+            'duration': time.perf_counter() - start,
+            'queries': counter.queries,
+            'sql_time': counter.sql_time,
+            'serialization_time': timer.elapsed,
+            'render_time': request.profiling_render_time,
+            'size': 0,
+        }
+        if response.streaming:
+            response.streaming_content = self.count_streamed(
+                response.streaming_content, request, endpoint, sample
+            )
+        else:
+            sample['size'] = len(response.content)
+            self.record(request, endpoint, sample)
+        return response
+
+    def count_streamed(self, content, request, endpoint, sample):
+        try:
+            for chunk in content:
+                sample['size'] += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, endpoint, sample)
+
+    def record(self, request, endpoint, sample):
+        registry.add(endpoint, sample)
+        budget = settings.PROFILING_QUERY_BUDGETS.get(
+            endpoint, settings.PROFILING_QUERY_BUDGET
+        )
+        if sample['queries'] > budget:
+            logger.warning(
+                '%s %s (%s): %s SQL-запросов при бюджете %s',
+                request.method,
+                request.path,
+                endpoint,
+                sample['queries'],
+                budget,
+            )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.profiling_endpoint = get_endpoint_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+        response.render()
+        request.profiling_render_time = time.perf_counter() - start
+        return response
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -85,11 +87,54 @@ DATABASES_PROD = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
         'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_TRANSACTION_POOLING', False) == 'True'
+        ),
     }
 }
 
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+DB_STATS_LOG_EVERY = int(os.getenv('DB_STATS_LOG_EVERY', 1000))
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', False) == 'True'
+PROFILING_WINDOW = int(os.getenv('PROFILING_WINDOW', 1000))
+PROFILING_QUERY_BUDGET = int(os.getenv('PROFILING_QUERY_BUDGET', 20))
+PROFILING_QUERY_BUDGETS = {}
+
 DATABASES = DATABASES_PROD
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Кэш представлений рецептов и ETag по версиям таблиц включаются только
+# с общим для всех процессов кэшем: в LocMemCache каждый воркер
+# gunicorn видел бы свои версии и не получал бы сбросов от остальных.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram': {
+            'handlers': ['console'],
+            'level': os.getenv('FOODGRAM_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -124,6 +169,32 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+RECIPE_IMAGE_SPOOL_SIZE = 1024 * 1024
+RECIPE_IMAGE_THUMBNAIL_SIZE = (480, 480)
+RECIPE_IMAGE_WEBP_QUALITY = 80
+RECIPE_IMAGE_VARIANTS_ASYNC = (
+    os.getenv('RECIPE_IMAGE_VARIANTS_ASYNC', False) == 'True'
+)
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 60 * 5))
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60 * 24))
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 60))
+
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', 100))
+
+JOB_HEARTBEAT_TIMEOUT = int(os.getenv('JOB_HEARTBEAT_TIMEOUT', 60 * 5))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 60 * 60 * 24))
+
+SHOPPINGCART_FONT = 'FreeSans'
+SHOPPINGCART_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPINGCART_CACHE_TIMEOUT', 60 * 60 * 24)
+)
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
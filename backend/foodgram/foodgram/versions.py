@@ -0,0 +1,55 @@
+import hashlib
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{}'
+
+
+def get_versions(*names):
+    """Версии таблиц из общего кэша.
+
+    Версия - время последнего изменения таблицы в наносекундах. Если
+    ключа нет в кэше, он заполняется текущим временем, поэтому после
+    сброса кэша старые ETag не совпадут с новыми.
+    """
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def bump_version(name):
+    """Новая версия таблицы после фиксации текущей транзакции.
+
+    До фиксации параллельный запрос ещё видит старые строки и закэшировал
+    бы их под новой версией. Вне транзакции версия меняется сразу.
+    """
+    transaction.on_commit(
+        lambda: cache.set(VERSION_KEY.format(name), time.time_ns(), None)
+    )
+
+
+def versions_etag(names, *parts):
+    def etag_func(request, *args, **kwargs):
+        values = get_versions(*names) + [
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            *(part(request, *args, **kwargs) for part in parts),
+        ]
+        return hashlib.sha256(
+            ':'.join(map(str, values)).encode()
+        ).hexdigest()
+    return etag_func
+
+
+def versions_last_modified(names):
+    def last_modified_func(request, *args, **kwargs):
+        return datetime.utcfromtimestamp(max(get_versions(*names)) / 1e9)
+    return last_modified_func
@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+
+from jobs.queue import (
+    claim_jobs,
+    delete_expired_jobs,
+    fail_job,
+    heartbeat,
+    release_jobs,
+    release_stale_jobs,
+    run_job,
+)
+
+CLEANUP_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов-исполнителей',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза между опросами пустой очереди, в секундах',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Завершиться, когда очередь опустеет',
+        )
+
+    def handle(self, *args, **options):
+        self.cleaned = None
+        while not self.run_pool(options):
+            self.stderr.write('Пул процессов сломан, создаётся новый')
+
+    def run_pool(self, options):
+        """Выполняет задачи в одном пуле процессов.
+
+        Возвращает True, если очередь опустела в режиме --burst, и False,
+        если процесс-исполнитель упал и пул нужно создать заново. Задачи
+        сломанного пула возвращаются в очередь.
+        """
+        processes = options['processes']
+        running = {}
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as pool:
+            while True:
+                self.delete_expired()
+                requeued, failed = release_stale_jobs()
+                if requeued or failed:
+                    self.stdout.write(
+                        f'Зависших задач возвращено в очередь: {requeued}, '
+                        f'отмечено ошибкой: {failed}'
+                    )
+                heartbeat(list(running.values()))
+                claimed = claim_jobs(processes - len(running))
+                try:
+                    while claimed:
+                        running[pool.submit(run_job, claimed[0])] = claimed[0]
+                        self.stdout.write(f'Задача {claimed.pop(0)} запущена')
+                except BrokenProcessPool:
+                    self.release(
+                        [*running.values(), *claimed], traceback.format_exc()
+                    )
+                    return False
+                if not running:
+                    if options['burst']:
+                        return True
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(
+                    running,
+                    timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED,
+                )
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        self.release([job_id], traceback.format_exc())
+                    except Exception:
+                        fail_job(job_id, traceback.format_exc())
+                        self.stderr.write(f'Задача {job_id} упала')
+                    else:
+                        self.report(job_id, result)
+                if broken:
+                    self.release(
+                        list(running.values()), 'Пул процессов сломан'
+                    )
+                    return False
+
+    def report(self, job_id, result):
+        if result is None:
+            self.stderr.write(
+                f'Задача {job_id} забрана другим воркером, итог отброшен'
+            )
+        else:
+            self.stdout.write(f'Задача {job_id} завершена: {result}')
+
+    def delete_expired(self):
+        """Раз в CLEANUP_INTERVAL секунд удаляет старые задачи и файлы."""
+        now = time.monotonic()
+        if self.cleaned is not None and now - self.cleaned < CLEANUP_INTERVAL:
+            return
+        self.cleaned = now
+        deleted = delete_expired_jobs()
+        if deleted:
+            self.stdout.write(f'Удалено старых задач: {deleted}')
+
+    def release(self, job_ids, error):
+        if not job_ids:
+            return
+        requeued, failed = release_jobs(job_ids, error)
+        self.stderr.write(
+            f'Задач возвращено в очередь: {requeued}, '
+            f'отмечено ошибкой: {failed}'
+        )
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('task', models.CharField(help_text='Имя зарегистрированной задачи', max_length=150, verbose_name='Задача')),
+                ('kwargs', models.JSONField(default=dict, help_text='Именованные аргументы задачи', verbose_name='Аргументы')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=15, verbose_name='Статус')),
+                ('result', models.FileField(blank=True, help_text='Файл, созданный задачей', null=True, upload_to='jobs/', verbose_name='Результат')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Время запуска')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Время завершения')),
+                ('user', models.ForeignKey(blank=True, help_text='Пользователь, поставивший задачу', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'created'], name='job_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Сколько раз задача забиралась воркером', verbose_name='Попытки'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, help_text='Обновляется воркером, пока задача выполняется', null=True, verbose_name='Последний сигнал'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+import uuid
+
+from django.db import models
+
+from users.models import User
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_LIST = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        help_text='Пользователь, поставивший задачу',
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        null=True,
+        blank=True,
+    )
+    task = models.CharField(
+        max_length=150,
+        verbose_name='Задача',
+        help_text='Имя зарегистрированной задачи',
+    )
+    kwargs = models.JSONField(
+        default=dict,
+        verbose_name='Аргументы',
+        help_text='Именованные аргументы задачи',
+    )
+    status = models.CharField(
+        max_length=15,
+        choices=STATUS_LIST,
+        default=PENDING,
+        verbose_name='Статус',
+    )
+    result = models.FileField(
+        upload_to='jobs/',
+        null=True,
+        blank=True,
+        verbose_name='Результат',
+        help_text='Файл, созданный задачей',
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name='Время создания'
+    )
+    started = models.DateTimeField(
+        null=True, blank=True, verbose_name='Время запуска'
+    )
+    finished = models.DateTimeField(
+        null=True, blank=True, verbose_name='Время завершения'
+    )
+    heartbeat = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Последний сигнал',
+        help_text='Обновляется воркером, пока задача выполняется',
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Попытки',
+        help_text='Сколько раз задача забиралась воркером',
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-created']
+        indexes = [
+            models.Index(fields=['status', 'created'], name='job_queue_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.task} ({self.status})'
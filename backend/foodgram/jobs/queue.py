@@ -0,0 +1,132 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+TASKS = {}
+
+
+def task(func):
+    """Регистрирует функцию как задачу для run_worker.
+
+    Задача получает объект Job и его kwargs. Если она возвращает файл
+    (ContentFile с именем), он сохраняется в Job.result.
+    """
+    TASKS[func.__name__] = func
+    return func
+
+
+def enqueue(task_name, user=None, **kwargs):
+    if task_name not in TASKS:
+        raise KeyError(f'Задача {task_name} не зарегистрирована')
+    return Job.objects.create(task=task_name, user=user, kwargs=kwargs)
+
+
+def claim_jobs(limit):
+    pending = Job.objects.filter(status=Job.PENDING).order_by('created')
+    claimed = []
+    for pk in pending.values_list('pk', flat=True)[:limit]:
+        now = timezone.now()
+        if Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            started=now,
+            heartbeat=now,
+            attempts=F('attempts') + 1,
+        ):
+            claimed.append(pk)
+    return claimed
+
+
+def heartbeat(job_ids):
+    """Отмечает, что задачи job_ids ещё выполняются этим воркером."""
+    if job_ids:
+        Job.objects.filter(pk__in=job_ids, status=Job.RUNNING).update(
+            heartbeat=timezone.now()
+        )
+
+
+def release_jobs(job_ids, error):
+    """Возвращает задачи в очередь или, если попытки кончились, — FAILED."""
+    running = Job.objects.filter(pk__in=job_ids, status=Job.RUNNING)
+    failed = running.filter(attempts__gte=settings.JOB_MAX_ATTEMPTS).update(
+        status=Job.FAILED, error=error, finished=timezone.now()
+    )
+    requeued = running.update(status=Job.PENDING, started=None)
+    return requeued, failed
+
+
+def release_stale_jobs():
+    """Освобождает задачи RUNNING, воркер которых перестал подавать сигнал.
+
+    Такие задачи остаются от воркера, который был убит или упал вместе
+    с процессом-исполнителем.
+    """
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.JOB_HEARTBEAT_TIMEOUT
+    )
+    stale = list(
+        Job.objects.filter(status=Job.RUNNING)
+        .filter(
+            Q(heartbeat__lt=cutoff)
+            | Q(heartbeat__isnull=True, started__lt=cutoff)
+        )
+        .values_list('pk', flat=True)
+    )
+    if not stale:
+        return 0, 0
+    return release_jobs(
+        stale, 'Воркер перестал отвечать во время выполнения задачи'
+    )
+
+
+def fail_job(job_id, error):
+    Job.objects.filter(pk=job_id, status=Job.RUNNING).update(
+        status=Job.FAILED, error=error, finished=timezone.now()
+    )
+
+
+def run_job(job_id):
+    """Выполняет задачу и сохраняет итог, если она всё ещё за воркером.
+
+    Число попыток растёт при каждом захвате, поэтому фильтр по нему
+    отличает текущий захват от повторного: если release_stale_jobs
+    вернул задачу в очередь и её забрал другой воркер, итог этого
+    запуска отбрасывается, а созданный им файл удаляется.
+    """
+    job = Job.objects.get(pk=job_id)
+    claim = Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, attempts=job.attempts
+    )
+    try:
+        result = TASKS[job.task](job, **job.kwargs)
+    except Exception:
+        claim.update(
+            status=Job.FAILED,
+            error=traceback.format_exc(),
+            finished=timezone.now(),
+        )
+        return Job.FAILED
+    name = ''
+    if result is not None:
+        storage = job.result.storage
+        name = storage.save(
+            job.result.field.generate_filename(job, result.name), result
+        )
+    if claim.update(status=Job.DONE, result=name, finished=timezone.now()):
+        return Job.DONE
+    if name:
+        storage.delete(name)
+    return None
+
+
+def delete_expired_jobs():
+    """Удаляет завершённые задачи старше JOB_RESULT_TTL вместе с файлами."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_RESULT_TTL)
+    deleted, _ = Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED), finished__lt=cutoff
+    ).delete()
+    return deleted
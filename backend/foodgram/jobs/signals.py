@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from jobs.models import Job
+
+
+@receiver(post_delete, sender=Job)
+def delete_job_result(sender, instance, **kwargs):
+    if instance.result:
+        instance.result.delete(save=False)
@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import (
+    TASKS,
+    claim_jobs,
+    delete_expired_jobs,
+    heartbeat,
+    release_jobs,
+    release_stale_jobs,
+    run_job,
+)
+
+
+def write_result(job):
+    return ContentFile(b'result', name='result.txt')
+
+
+def fail(job):
+    raise ValueError('Задача упала')
+
+
+def reclaim_and_write_result(job):
+    release_jobs([job.pk], 'Воркер перестал отвечать')
+    claim_jobs(1)
+    return write_result(job)
+
+
+@override_settings(JOB_HEARTBEAT_TIMEOUT=60, JOB_MAX_ATTEMPTS=2)
+class StaleJobTests(TestCase):
+    def create_job(self, minutes_ago, attempts=1, **fields):
+        moment = timezone.now() - timedelta(minutes=minutes_ago)
+        fields.setdefault('heartbeat', moment)
+        return Job.objects.create(
+            task='render_shoppingcart',
+            status=Job.RUNNING,
+            started=moment,
+            attempts=attempts,
+            **fields,
+        )
+
+    def test_stale_job_is_requeued_and_claimed_again(self):
+        job = self.create_job(minutes_ago=10)
+        self.assertEqual(release_stale_jobs(), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(claim_jobs(1), [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 2))
+
+    def test_stale_job_without_attempts_left_fails(self):
+        job = self.create_job(minutes_ago=10, attempts=2)
+        self.assertEqual(release_stale_jobs(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertTrue(job.error)
+
+    def test_heartbeat_keeps_job_running(self):
+        job = self.create_job(minutes_ago=10)
+        heartbeat([job.pk])
+        self.assertEqual(release_stale_jobs(), (0, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+    def test_job_without_heartbeat_uses_start_time(self):
+        job = self.create_job(minutes_ago=10, heartbeat=None)
+        self.assertEqual(release_stale_jobs(), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+
+
+@override_settings(JOB_HEARTBEAT_TIMEOUT=60, JOB_RESULT_TTL=60)
+class RunJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        tasks = mock.patch.dict(
+            TASKS,
+            {
+                'write_result': write_result,
+                'fail': fail,
+                'reclaim_and_write_result': reclaim_and_write_result,
+            },
+        )
+        tasks.start()
+        self.addCleanup(tasks.stop)
+
+    def get_files(self):
+        return [
+            name
+            for _, _, names in os.walk(self.media_root)
+            for name in names
+        ]
+
+    def run_claimed(self, task):
+        job = Job.objects.create(task=task)
+        self.assertEqual(claim_jobs(1), [job.pk])
+        status = run_job(job.pk)
+        job.refresh_from_db()
+        return status, job
+
+    def test_result_is_saved(self):
+        status, job = self.run_claimed('write_result')
+        self.assertEqual((status, job.status), (Job.DONE, Job.DONE))
+        with job.result.open('rb') as file:
+            self.assertEqual(file.read(), b'result')
+
+    def test_failed_task(self):
+        status, job = self.run_claimed('fail')
+        self.assertEqual((status, job.status), (Job.FAILED, Job.FAILED))
+        self.assertIn('ValueError', job.error)
+
+    def test_reclaimed_job_keeps_new_claim(self):
+        status, job = self.run_claimed('reclaim_and_write_result')
+        self.assertIsNone(status)
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 2))
+        self.assertFalse(job.result)
+        self.assertEqual(self.get_files(), [])
+
+    def test_job_of_dead_worker_is_finished_by_another(self):
+        moment = timezone.now() - timedelta(minutes=10)
+        job = Job.objects.create(
+            task='write_result',
+            status=Job.RUNNING,
+            started=moment,
+            heartbeat=moment,
+            attempts=1,
+        )
+        self.assertEqual(release_stale_jobs(), (1, 0))
+        self.assertEqual(claim_jobs(1), [job.pk])
+        self.assertEqual(run_job(job.pk), Job.DONE)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+
+    def test_expired_jobs_are_deleted_with_results(self):
+        _, expired = self.run_claimed('write_result')
+        _, recent = self.run_claimed('write_result')
+        Job.objects.filter(pk=expired.pk).update(
+            finished=timezone.now() - timedelta(minutes=10)
+        )
+        self.assertEqual(delete_expired_jobs(), 1)
+        self.assertEqual(list(Job.objects.all()), [recent])
+        self.assertEqual(
+            self.get_files(), [os.path.basename(recent.result.name)]
+        )
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import (Ingredient, IngredientRecipe, Tag)
+from . import shopping_list
+from .models import (Ingredient, IngredientRecipe, Recipe, Tag)
 
 
 class IngredientsInline(admin.TabularInline):
@@ -20,5 +21,37 @@ class IngredientAdminPanel(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class RecipeAdminPanel(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'name',
+        'author',
+        'favorites_count',
+        'in_carts_count',
+    )
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'author__email')
+    readonly_fields = ('favorites_count', 'in_carts_count')
+    filter_horizontal = ('tags',)
+    inlines = (IngredientsInline,)
+    raw_id_fields = ('author',)
+
+    def save_related(self, request, form, formsets, change):
+        """Переносит правку ингредиентов в списки покупок, как и API."""
+        recipe_id = form.instance.pk
+        before = {}
+        if change:
+            before = shopping_list.get_recipe_amounts([recipe_id])
+        super().save_related(request, form, formsets, change)
+        shopping_list.update_recipe_ingredients(
+            recipe_id,
+            shopping_list.get_deltas(
+                before, shopping_list.get_recipe_amounts([recipe_id])
+            ),
+        )
+
+
 admin.site.register(Ingredient, IngredientAdminPanel)
+admin.site.register(Recipe, RecipeAdminPanel)
 admin.site.register(Tag, TagAdminPanel)
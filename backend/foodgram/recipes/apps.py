@@ -1,6 +1,23 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        import recipes.signals  # noqa: F401
+
+        pdfmetrics.registerFont(
+            TTFont(
+                settings.SHOPPINGCART_FONT,
+                os.path.join(
+                    settings.BASE_DIR, 'recipes', 'static', 'FreeSans.ttf'
+                ),
+            )
+        )
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+RECIPE_KEY = 'recipe:{}'
+HITS_KEY = 'recipe_cache:hits'
+MISSES_KEY = 'recipe_cache:misses'
+
+
+def incr_counter(key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+
+
+def get_recipes(ids):
+    """Закэшированные представления рецептов, не зависящие от пользователя.
+
+    Без общего кэша (SHARED_CACHE) кэш представлений не используется.
+    """
+    if not settings.SHARED_CACHE:
+        return {}
+    keys = {RECIPE_KEY.format(pk): pk for pk in ids}
+    cached = cache.get_many(list(keys))
+    incr_counter(HITS_KEY, len(cached))
+    incr_counter(MISSES_KEY, len(keys) - len(cached))
+    return {keys[key]: data for key, data in cached.items()}
+
+
+def set_recipes(representations):
+    if not settings.SHARED_CACHE:
+        return
+    cache.set_many(
+        {
+            RECIPE_KEY.format(pk): data
+            for pk, data in representations.items()
+        },
+        settings.RECIPE_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_recipes(ids):
+    """Сбрасывает представления рецептов после фиксации транзакции.
+
+    id вычисляются сразу: после удаления связанные выборки уже пусты.
+    """
+    keys = [RECIPE_KEY.format(pk) for pk in ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_stats():
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {
+        'hits': counters.get(HITS_KEY, 0),
+        'misses': counters.get(MISSES_KEY, 0),
+    }
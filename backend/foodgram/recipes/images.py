@@ -0,0 +1,52 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+IMAGE_VARIANTS = {
+    'thumbnail': '_thumb.webp',
+    'webp': '.webp',
+}
+
+
+def get_variant_name(name, variant):
+    root, _ = os.path.splitext(name)
+    return root + IMAGE_VARIANTS[variant]
+
+
+def render_variant(image, variant):
+    image = image.copy()
+    if variant == 'thumbnail':
+        image.thumbnail(settings.RECIPE_IMAGE_THUMBNAIL_SIZE)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=settings.RECIPE_IMAGE_WEBP_QUALITY)
+    return buffer.getvalue()
+
+
+def create_image_variants(image_file):
+    """Сохраняет рядом с оригиналом уменьшенную копию и копию в WebP."""
+    storage = image_file.storage
+    with storage.open(image_file.name, 'rb') as file:
+        image = Image.open(file)
+        image.load()
+    for variant in IMAGE_VARIANTS:
+        name = get_variant_name(image_file.name, variant)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(render_variant(image, variant)))
+
+
+def get_image_variant_urls(image_file):
+    if not image_file:
+        return {}
+    storage = image_file.storage
+    urls = {}
+    for variant in IMAGE_VARIANTS:
+        name = get_variant_name(image_file.name, variant)
+        if storage.exists(name):
+            urls[variant] = storage.url(name)
+    return urls
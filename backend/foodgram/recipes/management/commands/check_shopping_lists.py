@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.versions import bump_version
+from recipes.shopping_list import find_inconsistencies, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет списки покупок с корзинами пользователей; завершается '
+        'ошибкой при расхождениях'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            nargs='*',
+            dest='user_ids',
+            help='id пользователей; по умолчанию все',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Пересобрать списки пользователей с расхождениями',
+        )
+
+    def handle(self, *args, **options):
+        inconsistencies = find_inconsistencies(options['user_ids'])
+        for (user_id, ingredient_id), (actual, expected) in sorted(
+            inconsistencies.items()
+        ):
+            self.stdout.write(
+                f'user {user_id}, ingredient {ingredient_id}: '
+                f'{actual} вместо {expected}'
+            )
+        if not inconsistencies:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        user_ids = sorted({user_id for user_id, _ in inconsistencies})
+        if options['fix']:
+            rebuild(user_ids)
+            bump_version('shoppingcarts')
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Пересобраны списки пользователей: {len(user_ids)}'
+                )
+            )
+            return
+        raise CommandError(
+            f'Расхождения в списках пользователей: {len(user_ids)}'
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cache import invalidate_recipes
+from recipes.images import create_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры и WebP-копии изображений рецептов'
+
+    def handle(self, *args, **options):
+        processed = []
+        for recipe in Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).only('id', 'image').iterator():
+            try:
+                create_image_variants(recipe.image)
+            except OSError as error:
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+                continue
+            processed.append(recipe.pk)
+        invalidate_recipes(processed)
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано рецептов: {len(processed)}')
+        )
@@ -0,0 +1,292 @@
+import io
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from foodgram.versions import bump_version
+from recipes.images import create_image_variants
+from recipes.management.commands.load_ingredients import read_csv
+from recipes.management.commands.reconcile_recipe_counters import (
+    reconcile_counters,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import ingredient_index
+from recipes.shopping_list import rebuild
+from users.models import Subscription, User
+
+DEFAULT_INGREDIENTS_PATH = (
+    settings.BASE_DIR.parent.parent / 'data' / 'ingredients.csv'
+)
+FAKE_IMAGE_NAME = 'media/fake_recipe.png'
+FAKE_TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+    ('Десерт', 'dessert', '#F2C94C'),
+    ('Выпечка', 'bakery', '#C0843D'),
+    ('Постное', 'lenten', '#56CCF2'),
+)
+BATCH_SIZE = 1000
+
+
+def zipf_weights(count, exponent):
+    """Веса степенного распределения: i-й по популярности ~ 1 / i^s."""
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def pareto_count(rng, alpha, maximum):
+    """Длина «хвоста» на пользователя: большинству мало, единицам много."""
+    return min(int(rng.paretovariate(alpha)) - 1, maximum)
+
+
+def sample_unique(rng, population, weights, count):
+    count = min(count, len(population))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(rng.choices(population, weights, k=count - len(chosen)))
+    return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, рецептами, '
+        'избранным, корзинами и подписками для нагрузочных замеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора: одинаковое зерно даёт одинаковые данные',
+        )
+        parser.add_argument(
+            '--exponent',
+            type=float,
+            default=1.1,
+            help='Показатель степенного распределения популярности',
+        )
+        parser.add_argument(
+            '--ingredients-path',
+            default=str(DEFAULT_INGREDIENTS_PATH),
+            help='CSV с ингредиентами, если таблица ингредиентов пуста',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно хотя бы 2 пользователя и 1 рецепт')
+        self.rng = random.Random(options['seed'])
+        self.exponent = options['exponent']
+        started = time.perf_counter()
+        with transaction.atomic():
+            ingredients = self.get_ingredients(options['ingredients_path'])
+            tags = self.get_tags()
+            users = self.create_users(options['users'], options['seed'])
+            recipes = self.create_recipes(
+                options['recipes'], users, ingredients, tags
+            )
+            counts = self.create_relations(users, recipes)
+            # bulk_create не отправляет сигналы, поэтому списки покупок
+            # и счётчики рецептов для новых связей собираются отдельно.
+            for start in range(0, len(users), BATCH_SIZE):
+                rebuild(users[start:start + BATCH_SIZE], BATCH_SIZE)
+            reconcile_counters()
+        for name in (
+            'ingredients',
+            'tags',
+            'users',
+            'recipes',
+            'favorites',
+            'shoppingcarts',
+            'subscriptions',
+        ):
+            bump_version(name)
+        ingredient_index.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+                + ', '.join(f'{key}: {value}' for key, value in counts.items())
+                + f' за {time.perf_counter() - started:.1f} с'
+            )
+        )
+
+    def get_ingredients(self, path):
+        if not Ingredient.objects.exists():
+            with open(path, encoding='utf-8', newline='') as file:
+                Ingredient.objects.bulk_create(
+                    (
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in read_csv(file)
+                    ),
+                    batch_size=BATCH_SIZE,
+                    ignore_conflicts=True,
+                )
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        self.rng.shuffle(ingredients)
+        return ingredients
+
+    def get_tags(self):
+        for name, slug, color in FAKE_TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, count, seed):
+        password = make_password('fake-password')
+        prefix = f'fake{seed}_'
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{index}',
+                    email=f'{prefix}{index}@example.com',
+                    first_name='Имя',
+                    last_name=f'Фамилия {index}',
+                    password=password,
+                )
+                for index in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return list(
+            User.objects.filter(username__startswith=prefix)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def create_image(self):
+        if not default_storage.exists(FAKE_IMAGE_NAME):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), '#C0843D').save(buffer, 'PNG')
+            default_storage.save(
+                FAKE_IMAGE_NAME, ContentFile(buffer.getvalue())
+            )
+        recipe = Recipe(image=FAKE_IMAGE_NAME)
+        create_image_variants(recipe.image)
+        return FAKE_IMAGE_NAME
+
+    def create_recipes(self, count, users, ingredients, tags):
+        image = self.create_image()
+        author_weights = zipf_weights(len(users), self.exponent)
+        authors = self.rng.choices(users, author_weights, k=count)
+        last_id = Recipe.objects.values_list('id', flat=True).first() or 0
+        first_id = last_id + 1
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    name=f'Рецепт {first_id + index}',
+                    author_id=author,
+                    text='Синтетический рецепт для нагрузочных замеров',
+                    image=image,
+                    cooking_time=self.rng.randint(5, 180),
+                )
+                for index, author in enumerate(authors)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        recipes = list(
+            Recipe.objects.filter(id__gte=first_id)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        ingredient_weights = zipf_weights(len(ingredients), self.exponent)
+        tag_weights = zipf_weights(len(tags), 0.5)
+        recipe_ingredients = []
+        recipe_tags = []
+        for recipe in recipes:
+            for ingredient in sample_unique(
+                self.rng,
+                ingredients,
+                ingredient_weights,
+                self.rng.randint(3, 12),
+            ):
+                recipe_ingredients.append(
+                    IngredientRecipe(
+                        recipe_id=recipe,
+                        ingredient_id=ingredient,
+                        amount=self.rng.choice((1, 2, 5, 10, 50, 100, 250)),
+                    )
+                )
+            for tag in sample_unique(
+                self.rng, tags, tag_weights, self.rng.randint(1, 3)
+            ):
+                recipe_tags.append(
+                    Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                )
+        IngredientRecipe.objects.bulk_create(
+            recipe_ingredients, batch_size=BATCH_SIZE
+        )
+        Recipe.tags.through.objects.bulk_create(
+            recipe_tags, batch_size=BATCH_SIZE
+        )
+        return recipes
+
+    def create_relations(self, users, recipes):
+        recipe_weights = zipf_weights(len(recipes), self.exponent)
+        author_weights = zipf_weights(len(users), self.exponent)
+        favorites = []
+        carts = []
+        subscriptions = []
+        for user in users:
+            favorites.extend(
+                Favorite(favorited_user_id=user, favorited_recipe_id=recipe)
+                for recipe in sample_unique(
+                    self.rng,
+                    recipes,
+                    recipe_weights,
+                    pareto_count(self.rng, 1.2, 200),
+                )
+            )
+            carts.extend(
+                ShoppingCart(
+                    shoppingcart_user_id=user, shoppingcart_recipe_id=recipe
+                )
+                for recipe in sample_unique(
+                    self.rng,
+                    recipes,
+                    recipe_weights,
+                    pareto_count(self.rng, 1.5, 50),
+                )
+            )
+            subscriptions.extend(
+                Subscription(subscriber_id=user, subscribed_to_id=author)
+                for author in sample_unique(
+                    self.rng,
+                    users,
+                    author_weights,
+                    pareto_count(self.rng, 1.2, 100),
+                )
+                if author != user
+            )
+        for model, objects in (
+            (Favorite, favorites),
+            (ShoppingCart, carts),
+            (Subscription, subscriptions),
+        ):
+            model.objects.bulk_create(
+                objects, batch_size=BATCH_SIZE, ignore_conflicts=True
+            )
+        return {
+            'избранное': len(favorites),
+            'корзины': len(carts),
+            'подписки': len(subscriptions),
+        }
@@ -0,0 +1,171 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from foodgram.versions import bump_version
+from recipes.cache import invalidate_recipes
+from recipes.models import Ingredient, IngredientRecipe
+from recipes.search import ingredient_index
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0].strip(), row[1].strip()
+
+
+def read_json(file):
+    """Построчно разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] in ('', ']'):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'].strip(), item['measurement_unit'].strip()
+        buffer = buffer[position:]
+
+
+class CSVStream:
+    """Файлоподобная обёртка над строками для COPY FROM STDIN."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+        self.buffer = ''
+        self.writer = csv.writer(self)
+
+    def write(self, value):
+        self.buffer += value
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.count += 1
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    readline = read
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к ingredients.csv/.json')
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла; по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки bulk_create для баз кроме PostgreSQL',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1][1:]
+        readers = {'csv': read_csv, 'json': read_json}
+        if file_format not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        started = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = readers[file_format](file)
+            changed = []
+            if connection.vendor == 'postgresql':
+                count, changed = self.copy_postgresql(rows)
+            else:
+                count = self.bulk_create(rows, options['batch_size'])
+        elapsed = time.perf_counter() - started
+        ingredient_index.invalidate()
+        bump_version('ingredients')
+        if changed:
+            # Единица измерения входит в закэшированные представления
+            # рецептов с этими ингредиентами.
+            invalidate_recipes(
+                IngredientRecipe.objects.filter(ingredient__in=changed)
+                .values_list('recipe', flat=True)
+                .distinct()
+            )
+            bump_version('recipes')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Загружено строк: {count} за {elapsed:.2f} с '
+                f'({count / elapsed if elapsed else count:.0f} строк/с)'
+            )
+        )
+
+    def copy_postgresql(self, rows):
+        """COPY во временную таблицу и upsert в таблицу ингредиентов.
+
+        Возвращает число прочитанных строк и id вставленных или
+        изменённых ингредиентов; строки без изменений не перезаписываются.
+        """
+        table = Ingredient._meta.db_table
+        stream = CSVStream(rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_staging '
+                '(name varchar(150), measurement_unit varchar(150)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                stream,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT ON (name) name, measurement_unit '
+                'FROM ingredient_staging '
+                'ON CONFLICT (name) DO UPDATE '
+                'SET measurement_unit = EXCLUDED.measurement_unit '
+                f'WHERE {table}.measurement_unit '
+                'IS DISTINCT FROM EXCLUDED.measurement_unit '
+                'RETURNING id'
+            )
+            changed = [pk for (pk,) in cursor.fetchall()]
+        return stream.count, changed
+
+    def bulk_create(self, rows, batch_size):
+        count = 0
+        batch = []
+        for name, measurement_unit in rows:
+            batch.append(
+                Ingredient(name=name, measurement_unit=measurement_unit)
+            )
+            if len(batch) >= batch_size:
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                count += len(batch)
+                batch = []
+        if batch:
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+        return count
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.versions import bump_version
+from recipes.shopping_list import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает списки покупок по корзинам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            nargs='*',
+            dest='user_ids',
+            help='id пользователей; по умолчанию все',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuild(options['user_ids'], options['batch_size'])
+        bump_version('shoppingcarts')
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
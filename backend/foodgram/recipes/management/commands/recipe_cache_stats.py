@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cache import get_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает число попаданий и промахов кэша рецептов'
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'hits: {stats["hits"]}, misses: {stats["misses"]}, '
+            f'hit ratio: {ratio:.2%}'
+        )
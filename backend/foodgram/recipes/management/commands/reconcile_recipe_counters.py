@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+COUNTERS = {
+    'favorites_count': (Favorite, 'favorited_recipe'),
+    'in_carts_count': (ShoppingCart, 'shoppingcart_recipe'),
+}
+
+
+def count_by_recipe(model, recipe_field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{recipe_field: OuterRef('pk')})
+            .order_by()
+            .values(recipe_field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def reconcile_counters(batch_size=5000, dry_run=False):
+    """Исправляет счётчики рецептов, расходящиеся с числом записей.
+
+    Возвращает число рецептов с расхождениями.
+    """
+    actual = {
+        f'actual_{field}': count_by_recipe(model, recipe_field)
+        for field, (model, recipe_field) in COUNTERS.items()
+    }
+    drift = Q()
+    for field in COUNTERS:
+        drift |= ~Q(**{field: F(f'actual_{field}')})
+    queryset = Recipe.objects.order_by('pk').annotate(**actual)
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[
+                :batch_size
+            ]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1]
+        wrong = list(
+            queryset.filter(pk__in=batch)
+            .filter(drift)
+            .values_list('pk', flat=True)
+        )
+        fixed += len(wrong)
+        if dry_run or not wrong:
+            continue
+        # Значения пересчитываются в самом UPDATE, чтобы не затереть
+        # изменения, сделанные между выборкой и обновлением.
+        Recipe.objects.filter(pk__in=wrong).update(
+            **{
+                field: count_by_recipe(model, recipe_field)
+                for field, (model, recipe_field) in COUNTERS.items()
+            }
+        )
+    return fixed
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного и корзин у рецептов с фактическим '
+        'числом записей и исправляет расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число расхождений',
+        )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters(options['batch_size'], options['dry_run'])
+        action = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(
+            self.style.SUCCESS(f'{action} рецептов с расхождениями: {fixed}')
+        )
@@ -0,0 +1,67 @@
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def clean_amount(value):
+    digits = re.sub('[^0-9]', '', value or '')
+    return max(int(digits), 1) if digits else 1
+
+
+def forwards(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    queryset = IngredientRecipe.objects.order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk).only('pk', 'amount')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for item in batch:
+            item.amount_value = clean_amount(item.amount)
+        IngredientRecipe.objects.bulk_update(batch, ['amount_value'])
+        last_pk = batch[-1].pk
+
+
+def backwards(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    IngredientRecipe.objects.update(
+        amount=models.functions.Cast('amount_value', models.CharField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_delete_ingredientamountrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredientrecipe',
+            name='amount_value',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name='ingredientrecipe',
+            name='amount',
+        ),
+        migrations.RenameField(
+            model_name='ingredientrecipe',
+            old_name='amount_value',
+            new_name='amount',
+        ),
+        migrations.AlterField(
+            model_name='ingredientrecipe',
+            name='amount',
+            field=models.PositiveIntegerField(default=1, help_text='Добавьте количество ингредиента', verbose_name='Количество ингредиента'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientrecipe',
+            index=models.Index(fields=['recipe', 'ingredient', 'amount'], name='recipe_ingredient_amount_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:28
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_by_recipe(model, recipe_field):
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(**{recipe_field: models.OuterRef('pk')})
+            .order_by()
+            .values(recipe_field)
+            .annotate(count=models.Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def forwards(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Recipe.objects.update(
+        favorites_count=count_by_recipe(Favorite, 'favorited_recipe'),
+        in_carts_count=count_by_recipe(ShoppingCart, 'shoppingcart_recipe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Сколько пользователей добавили рецепт в избранное', verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Сколько пользователей добавили рецепт в список покупок', verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_popular_idx'),
+        ),
+    ]
@@ -116,6 +116,18 @@ class Recipe(models.Model):
         verbose_name='Поле связи с моделью тега',
         help_text='Укажите тег',
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        help_text='Сколько пользователей добавили рецепт в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        help_text='Сколько пользователей добавили рецепт в список покупок',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -126,10 +138,36 @@ class Recipe(models.Model):
                 fields=['author', 'name'], name='unique_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', '-id'], name='recipe_author_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'], name='recipe_popular_idx'
+            ),
+        ]
+
+    COUNTER_FIELDS = ('favorites_count', 'in_carts_count')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, update_fields=None, **kwargs):
+        """Сохранение существующего рецепта без полей-счётчиков.
+
+        Счётчики меняются только через F()-выражения, а значения в
+        загруженном объекте могут устареть: полное сохранение затёрло бы
+        параллельные изменения.
+        """
+        if update_fields is None and not self._state.adding:
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
 
 class IngredientRecipe(models.Model):
     ingredient = models.ForeignKey(
@@ -146,10 +184,9 @@ class IngredientRecipe(models.Model):
         on_delete=models.CASCADE,
         related_name='RecipeIngredients',
     )
-    amount = models.CharField(
+    amount = models.PositiveIntegerField(
         verbose_name='Количество ингредиента',
         help_text='Добавьте количество ингредиента',
-        max_length=150,
         default=1,
     )
 
@@ -162,6 +199,12 @@ class IngredientRecipe(models.Model):
                 name='unique_recipe_ingredients',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient', 'amount'],
+                name='recipe_ingredient_amount_idx',
+            )
+        ]
 
 
 class Favorite(models.Model):
@@ -189,6 +232,12 @@ class Favorite(models.Model):
                 name='unique_favorited',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['favorited_recipe', 'favorited_user'],
+                name='favorite_recipe_user_idx',
+            )
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -216,3 +265,52 @@ class ShoppingCart(models.Model):
                 name='unique_shoppingcart',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['shoppingcart_recipe', 'shoppingcart_user'],
+                name='shoppingcart_recipe_user_idx',
+            )
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """Итог списка покупок пользователя по одному ингредиенту.
+
+    Материализованная сумма количеств ингредиента по всем рецептам в
+    корзине пользователя; поддерживается recipes.shopping_list.
+    """
+
+    user = models.ForeignKey(
+        'users.User',
+        verbose_name='Пользователь',
+        help_text='Владелец списка покупок',
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        help_text='Ингредиент из рецептов в корзине',
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        help_text='Суммарное количество по всем рецептам в корзине',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'total_amount', 'ingredient'],
+                name='shopping_list_user_idx',
+            )
+        ]
@@ -0,0 +1,132 @@
+from collections import namedtuple
+from decimal import Decimal
+
+Unit = namedtuple('Unit', ('dimension', 'factor'))
+
+MASS = 'mass'
+VOLUME = 'volume'
+
+# Единицы из data/ingredients.csv, которые переводятся друг в друга.
+# Базовые единицы: граммы для массы и миллилитры для объёма. Ложки и
+# стакан приведены к миллилитрам по принятым кулинарным мерам.
+UNITS = {
+    'г': Unit(MASS, 1),
+    'кг': Unit(MASS, 1000),
+    'мл': Unit(VOLUME, 1),
+    'л': Unit(VOLUME, 1000),
+    'ч. л.': Unit(VOLUME, 5),
+    'ст. л.': Unit(VOLUME, 15),
+    'стакан': Unit(VOLUME, 250),
+}
+# Единицы для вывода, от крупной к мелкой.
+DISPLAY_UNITS = {
+    MASS: (('кг', 1000), ('г', 1)),
+    VOLUME: (('л', 1000), ('мл', 1)),
+}
+METRIC_UNITS = {
+    name for units in DISPLAY_UNITS.values() for name, _ in units
+}
+# Единицы без количества: суммировать нечего.
+UNQUANTIFIED_UNITS = {'по вкусу'}
+HUNDREDTHS = Decimal('0.01')
+
+
+ParsedUnit = namedtuple(
+    'ParsedUnit', ('kind', 'factor', 'convertible', 'metric', 'quantified')
+)
+
+
+def normalize_unit(name):
+    return ' '.join(name.split()).lower()
+
+
+def parse_unit(name):
+    """Разбор единицы для суммирования.
+
+    kind — размерность для переводимых единиц, иначе сама единица:
+    строки разных неизвестных единиц не складываются друг с другом.
+    """
+    normalized = normalize_unit(name)
+    unit = UNITS.get(normalized)
+    if unit is None:
+        return ParsedUnit(
+            normalized, 1, False, False, normalized not in UNQUANTIFIED_UNITS
+        )
+    return ParsedUnit(
+        unit.dimension, unit.factor, True, normalized in METRIC_UNITS, True
+    )
+
+
+def to_base(amount, unit):
+    """Количество в базовой единице измерения unit."""
+    return amount * UNITS[normalize_unit(unit)].factor
+
+
+def round_amount(value):
+    """Количество до сотых: int для целых, иначе точный Decimal."""
+    value = Decimal(value).quantize(HUNDREDTHS)
+    if value == value.to_integral_value():
+        return int(value)
+    return value.normalize()
+
+
+def from_base(amount, dimension):
+    """(единица, количество) в самой крупной удобной единице.
+
+    Крупная единица выбирается, только если количество в ней не меньше
+    1 и записывается точно до сотых: 1250 г — это 1.25 кг, а 1005 г
+    остаются граммами, чтобы округление не теряло часть покупки.
+    """
+    for name, factor in DISPLAY_UNITS[dimension]:
+        value = Decimal(amount) / factor
+        if abs(value) >= 1 and value == value.quantize(HUNDREDTHS):
+            return name, round_amount(value)
+    name, factor = DISPLAY_UNITS[dimension][-1]
+    return name, round_amount(Decimal(amount) / factor)
+
+
+def aggregate_quantities(rows):
+    """Суммирует строки списка покупок с учётом единиц измерения.
+
+    rows — уже просуммированные по ингредиенту строки с ключами name,
+    measurement_unit и total_amount. Строки одного названия с
+    совместимыми единицами (г и кг, мл, ложки и стакан) складываются в
+    базовой единице за один проход и выводятся в удобной: 1.2 кг
+    вместо 1200 г. Ложки и стаканы без примеси других единиц остаются
+    как есть. Для единиц без количества total_amount равен None.
+    Остальные ключи (например, id) берутся из первой строки группы,
+    порядок строк сохраняется по первому вхождению названия.
+    """
+    # Различных единиц в корзине единицы, строк — тысячи: разбор
+    # единицы выполняется один раз на её написание.
+    parsed_units = {}
+    groups = {}
+    for row in rows:
+        unit_name = row['measurement_unit']
+        parsed = parsed_units.get(unit_name)
+        if parsed is None:
+            parsed = parsed_units[unit_name] = parse_unit(unit_name)
+        key = (row['name'], parsed.kind)
+        amount = row['total_amount'] * parsed.factor
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [row, unit_name, parsed, amount, False]
+        else:
+            group[3] += amount
+            group[4] = group[4] or group[1] != unit_name
+    result = []
+    for row, unit_name, parsed, total, mixed in groups.values():
+        if not parsed.quantified:
+            total_amount = None
+        elif parsed.convertible and (mixed or parsed.metric):
+            unit_name, total_amount = from_base(total, parsed.kind)
+        else:
+            total_amount = round_amount(Decimal(total) / parsed.factor)
+        result.append(
+            {
+                **row,
+                'measurement_unit': unit_name,
+                'total_amount': total_amount,
+            }
+        )
+    return result
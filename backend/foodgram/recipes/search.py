@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+
+from foodgram.versions import get_versions
+from recipes.models import Ingredient
+
+logger = logging.getLogger(__name__)
+
+
+class IngredientSearchIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Названия хранятся отсортированными, поэтому поиск по началу строки
+    сводится к бинарному поиску. Совпадения по началу названия отдаются
+    раньше совпадений по подстроке. Индекс сбрасывается сигналами при
+    изменении ингредиентов, а также при смене версии таблицы
+    ингредиентов в общем кэше или по истечении INGREDIENT_INDEX_TTL
+    секунд, чтобы подхватить изменения из других процессов.
+
+    Запрос никогда не ждёт пересборки: индекс пересобирается в фоновом
+    потоке, а пока его нет или версия таблицы сменилась, поиск идёт по
+    базе. По истечении TTL до конца пересборки отдаётся старый индекс.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._keys = None
+        self._ingredients = None
+        self._built_at = 0
+        self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._ingredients = None
+
+    def build(self, version=None):
+        ingredients = sorted(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+            key=lambda item: item[1].lower(),
+        )
+        with self._lock:
+            self._ingredients = [
+                Ingredient(id=pk, name=name, measurement_unit=unit)
+                for pk, name, unit in ingredients
+            ]
+            self._keys = [name.lower() for _, name, _ in ingredients]
+            self._built_at = time.monotonic()
+            self._version = version
+
+    def rebuild(self, version):
+        """Пересобирает индекс в фоне, если его уже не пересобирают."""
+        if not self._build_lock.acquire(blocking=False):
+            return
+        thread = threading.Thread(
+            target=self._rebuild, args=(version,), daemon=True
+        )
+        try:
+            thread.start()
+        except RuntimeError:
+            self._build_lock.release()
+            raise
+
+    def _rebuild(self, version):
+        try:
+            self.build(version)
+        except Exception:
+            logger.exception('Не удалось пересобрать индекс ингредиентов')
+        finally:
+            self._build_lock.release()
+            connections.close_all()
+
+    def search(self, query, limit):
+        query = query.strip().lower()
+        (version,) = get_versions('ingredients')
+        with self._lock:
+            keys, ingredients = self._keys, self._ingredients
+            outdated = keys is None or version != self._version
+            expired = (
+                time.monotonic() - self._built_at
+                >= settings.INGREDIENT_INDEX_TTL
+            )
+        if outdated or expired:
+            self.rebuild(version)
+        if outdated:
+            return self.search_db(query, limit)
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit:
+            if not keys[end].startswith(query):
+                break
+            end += 1
+        results = ingredients[start:end]
+        for index, key in enumerate(keys):
+            if len(results) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                results.append(ingredients[index])
+        return results
+
+    def search_db(self, query, limit):
+        results = list(
+            Ingredient.objects.filter(name__istartswith=query).order_by(
+                'name'
+            )[:limit]
+        )
+        if len(results) < limit:
+            results += list(
+                Ingredient.objects.filter(name__icontains=query)
+                .exclude(name__istartswith=query)
+                .order_by('name')[: limit - len(results)]
+            )
+        return results
+
+
+ingredient_index = IngredientSearchIndex()
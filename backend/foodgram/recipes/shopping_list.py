@@ -0,0 +1,169 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import IngredientRecipe, ShoppingCart, ShoppingListItem
+from users.models import User
+
+
+def get_recipe_amounts(recipe_ids):
+    """{ingredient_id: количество} суммарно по рецептам recipe_ids."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe__in=recipe_ids)
+        .values_list('ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+
+
+def get_deltas(before, after):
+    """Изменения {ingredient_id: разница} между двумя наборами количеств."""
+    return {
+        ingredient_id: after.get(ingredient_id, 0)
+        - before.get(ingredient_id, 0)
+        for ingredient_id in before.keys() | after.keys()
+    }
+
+
+def get_cart_totals(user_ids=None):
+    """Списки покупок, посчитанные заново по корзинам и рецептам."""
+    # Условия на корзину задаются одним filter(): второй вызов по
+    # многозначной связи добавил бы ещё один JOIN и размножил строки.
+    lookup = {'recipe__shoppingcart_recipe__isnull': False}
+    if user_ids is not None:
+        lookup = {
+            'recipe__shoppingcart_recipe__shoppingcart_user__in': user_ids
+        }
+    queryset = IngredientRecipe.objects.filter(**lookup).values_list(
+        'recipe__shoppingcart_recipe__shoppingcart_user', 'ingredient'
+    )
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in queryset.annotate(
+            total=Sum('amount')
+        ).order_by()
+    }
+
+
+def lock_users(user_ids):
+    """Блокирует строки пользователей до конца транзакции.
+
+    Блокировки берутся в порядке id. Изменения избранного, корзины и
+    списка покупок одного пользователя под этой блокировкой выполняются
+    по очереди, а повторная блокировка в той же транзакции не ждёт.
+    """
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=user_ids)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def apply_deltas(user_ids, deltas):
+    """Прибавляет deltas {ingredient_id: изменение} к спискам user_ids.
+
+    Строки пользователей блокируются lock_users. Позиции с нулевым
+    итогом удаляются.
+    """
+    deltas = {key: value for key, value in deltas.items() if value}
+    user_ids = sorted(set(user_ids))
+    if not user_ids or not deltas:
+        return
+    with transaction.atomic():
+        lock_users(user_ids)
+        items = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                user__in=user_ids, ingredient__in=deltas
+            )
+        }
+        to_create = []
+        to_update = []
+        to_delete = []
+        for user_id in user_ids:
+            for ingredient_id, delta in deltas.items():
+                item = items.get((user_id, ingredient_id))
+                if item is None:
+                    if delta > 0:
+                        to_create.append(
+                            ShoppingListItem(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                total_amount=delta,
+                            )
+                        )
+                    continue
+                item.total_amount += delta
+                if item.total_amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+        if to_delete:
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ShoppingListItem.objects.bulk_update(to_update, ['total_amount'])
+        if to_create:
+            ShoppingListItem.objects.bulk_create(to_create)
+
+
+def add_recipes(user_id, recipe_ids, sign=1):
+    amounts = get_recipe_amounts(recipe_ids)
+    apply_deltas(
+        [user_id],
+        {ingredient: sign * amount for ingredient, amount in amounts.items()},
+    )
+
+
+def remove_recipes(user_id, recipe_ids):
+    add_recipes(user_id, recipe_ids, sign=-1)
+
+
+def update_recipe_ingredients(recipe_id, deltas):
+    """Переносит изменение ингредиентов рецепта в списки покупок."""
+    apply_deltas(
+        ShoppingCart.objects.filter(shoppingcart_recipe=recipe_id).values_list(
+            'shoppingcart_user', flat=True
+        ),
+        deltas,
+    )
+
+
+def find_inconsistencies(user_ids=None):
+    """Расхождения {(user_id, ingredient_id): (в таблице, должно быть)}."""
+    expected = get_cart_totals(user_ids)
+    queryset = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user__in=user_ids)
+    actual = {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in queryset.values_list(
+            'user', 'ingredient', 'total_amount'
+        )
+    }
+    return {
+        key: (actual.get(key, 0), expected.get(key, 0))
+        for key in actual.keys() | expected.keys()
+        if actual.get(key, 0) != expected.get(key, 0)
+    }
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """Пересобирает списки покупок user_ids (всех, если None) с нуля."""
+    with transaction.atomic():
+        queryset = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user__in=user_ids)
+        queryset.delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total,
+                )
+                for (user_id, ingredient_id), total in get_cart_totals(
+                    user_ids
+                ).items()
+            ),
+            batch_size=batch_size,
+        )
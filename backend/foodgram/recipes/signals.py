@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from foodgram.versions import bump_version
+from recipes.cache import invalidate_recipes
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.search import ingredient_index
+from recipes import shopping_list
+from users.models import Subscription, User
+
+VERSIONED_MODELS = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+    Recipe: 'recipes',
+    IngredientRecipe: 'recipes',
+    Recipe.tags.through: 'recipes',
+    User: 'users',
+    Favorite: 'favorites',
+    ShoppingCart: 'shoppingcarts',
+    Subscription: 'subscriptions',
+    ShoppingListItem: 'shoppingcarts',
+}
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver([post_save, post_delete, m2m_changed])
+def bump_table_version(sender, action=None, **kwargs):
+    if sender not in VERSIONED_MODELS:
+        return
+    if action is not None and not action.startswith('post_'):
+        return
+    bump_version(VERSIONED_MODELS[sender])
+
+
+AUTHOR_FIELDS = {'first_name', 'last_name', 'email', 'username'}
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+@receiver([post_save, post_delete], sender=Recipe.tags.through)
+def invalidate_recipe_relation(sender, instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+@receiver([post_save, pre_delete], sender=Ingredient)
+def invalidate_related_recipes(sender, instance, **kwargs):
+    invalidate_recipes(instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not AUTHOR_FIELDS.intersection(update_fields):
+        return
+    invalidate_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_recipes(instance.recipe_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_recipes(pk_set)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipes(
+            instance.shoppingcart_user_id, [instance.shoppingcart_recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """Вычитает рецепт из списка покупок до удаления строки корзины.
+
+    pre_delete отправляется до каскадного удаления ингредиентов
+    рецепта, поэтому при удалении самого рецепта его количества ещё
+    можно прочитать.
+    """
+    shopping_list.remove_recipes(
+        instance.shoppingcart_user_id, [instance.shoppingcart_recipe_id]
+    )
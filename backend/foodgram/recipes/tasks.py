@@ -0,0 +1,12 @@
+from jobs.queue import task
+from recipes.cache import invalidate_recipes
+from recipes.images import create_image_variants
+from recipes.models import Recipe
+
+
+@task
+def create_recipe_image_variants(job, recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is not None and recipe.image:
+        create_image_variants(recipe.image)
+        invalidate_recipes([recipe_id])
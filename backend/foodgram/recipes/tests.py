@@ -0,0 +1,500 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from foodgram.versions import get_versions
+from recipes import shopping_list
+from recipes.cache import RECIPE_KEY
+from recipes.search import IngredientSearchIndex
+from recipes.models import (
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.quantities import (
+    UNITS,
+    aggregate_quantities,
+    from_base,
+    to_base,
+)
+from users.models import User
+
+
+def create_user(index=0, superuser=False):
+    create = (
+        User.objects.create_superuser
+        if superuser
+        else User.objects.create_user
+    )
+    return create(
+        email=f'user{index}@example.com',
+        username=f'user{index}',
+        password='password',
+        first_name='Имя',
+        last_name='Фамилия',
+    )
+
+
+def create_recipe(author, **fields):
+    return Recipe.objects.create(
+        name='Рецепт',
+        author=author,
+        text='Описание',
+        cooking_time=5,
+        image='media/recipe.png',
+        **fields,
+    )
+
+
+def create_ingredients(*names):
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in names
+    ]
+
+
+class RecipeSaveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = create_recipe(create_user())
+
+    def test_save_keeps_concurrent_counter_updates(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=F('favorites_count') + 1,
+            in_carts_count=F('in_carts_count') + 2,
+        )
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 2)
+
+
+class AmountMigrationTests(TransactionTestCase):
+    """Перенос строковых количеств в PositiveIntegerField."""
+
+    users_leaf = ('users', '0007_subscription_subscriber_index')
+    migrate_from = [
+        ('recipes', '0012_delete_ingredientamountrecipe'),
+        users_leaf,
+    ]
+    migrate_to = [
+        ('recipes', '0013_ingredientrecipe_amount_integer'),
+        users_leaf,
+    ]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_amounts_are_cleaned(self):
+        apps = self.migrate(self.migrate_from)
+        author = apps.get_model('users', 'User').objects.create(
+            email='user0@example.com', username='user0'
+        )
+        recipe = apps.get_model('recipes', 'Recipe').objects.create(
+            name='Рецепт', author=author, text='Описание', cooking_time=5
+        )
+        ingredient_model = apps.get_model('recipes', 'Ingredient')
+        amounts = {
+            '200': 200,
+            ' 1 500 г': 1500,
+            '0': 1,
+            '': 1,
+            'щепотка': 1,
+        }
+        for index, amount in enumerate(amounts):
+            apps.get_model('recipes', 'IngredientRecipe').objects.create(
+                recipe=recipe,
+                ingredient=ingredient_model.objects.create(
+                    name=f'Ингредиент {index}', measurement_unit='г'
+                ),
+                amount=amount,
+            )
+        apps = self.migrate(self.migrate_to)
+        self.assertEqual(
+            list(
+                apps.get_model('recipes', 'IngredientRecipe')
+                .objects.order_by('ingredient__name')
+                .values_list('amount', flat=True)
+            ),
+            list(amounts.values()),
+        )
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, 'recipes_ingredientrecipe'
+            )
+        self.assertEqual(
+            constraints['recipe_ingredient_amount_idx']['columns'],
+            ['recipe_id', 'ingredient_id', 'amount'],
+        )
+
+
+class LoadIngredientsTests(TestCase):
+    """Загрузка справочника ингредиентов из CSV и JSON."""
+
+    rows = [('абрикос', 'г'), ('банан', 'шт'), ('вода', 'мл')]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def write_csv(self, rows):
+        return self.write(
+            'ingredients.csv',
+            ''.join(f'{name},{unit}\n' for name, unit in rows),
+        )
+
+    def write_json(self, rows):
+        return self.write(
+            'ingredients.json',
+            json.dumps(
+                [
+                    {'name': name, 'measurement_unit': unit}
+                    for name, unit in rows
+                ],
+                ensure_ascii=False,
+                indent=2,
+            ),
+        )
+
+    def load(self, path, **options):
+        call_command('load_ingredients', path, stdout=StringIO(), **options)
+        return sorted(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+
+    def test_formats(self):
+        for write in (self.write_csv, self.write_json):
+            with self.subTest(write=write.__name__):
+                Ingredient.objects.all().delete()
+                self.assertEqual(self.load(write(self.rows)), self.rows)
+
+    def test_json_is_read_in_chunks(self):
+        path = self.write_json(self.rows)
+        with mock.patch(
+            'recipes.management.commands.load_ingredients.CHUNK_SIZE', 7
+        ):
+            self.assertEqual(self.load(path), self.rows)
+
+    def test_reload_is_idempotent(self):
+        path = self.write_csv(self.rows)
+        self.load(path, batch_size=2)
+        ids = sorted(Ingredient.objects.values_list('id', flat=True))
+        self.assertEqual(self.load(path, batch_size=2), self.rows)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('id', flat=True)), ids
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'Нужен COPY PostgreSQL')
+    @override_settings(SHARED_CACHE=True)
+    def test_copy_updates_units_and_invalidates_recipes(self):
+        self.load(self.write_csv(self.rows))
+        recipe = create_recipe(create_user())
+        IngredientRecipe.objects.create(
+            recipe=recipe,
+            ingredient=Ingredient.objects.get(name='банан'),
+            amount=2,
+        )
+        cache.set(RECIPE_KEY.format(recipe.pk), {'id': recipe.pk})
+        rows = [('абрикос', 'г'), ('банан', 'г'), ('банан', 'г')]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(
+                self.load(self.write_csv(rows)),
+                [('абрикос', 'г'), ('банан', 'г'), ('вода', 'мл')],
+            )
+        self.assertIsNone(cache.get(RECIPE_KEY.format(recipe.pk)))
+
+
+class RecipeAdminShoppingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user(superuser=True)
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.recipe = create_recipe(cls.admin)
+        cls.recipe.tags.set([cls.tag])
+        cls.flour, cls.sugar, cls.salt = create_ingredients(
+            'мука', 'сахар', 'соль'
+        )
+        cls.flour_row = IngredientRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.flour, amount=100
+        )
+        cls.sugar_row = IngredientRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.sugar, amount=20
+        )
+        ShoppingCart.objects.create(
+            shoppingcart_user=cls.admin, shoppingcart_recipe=cls.recipe
+        )
+
+    def get_shopping_list(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.admin).values_list(
+                'ingredient__name', 'total_amount'
+            )
+        )
+
+    def test_admin_inline_edit_updates_shopping_list(self):
+        self.assertEqual(self.get_shopping_list(), {'мука': 100, 'сахар': 20})
+        self.client.force_login(self.admin)
+        prefix = 'RecipeIngredients'
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.pk}/change/',
+            {
+                'name': self.recipe.name,
+                'author': self.admin.pk,
+                'text': self.recipe.text,
+                'cooking_time': self.recipe.cooking_time,
+                'tags': [self.tag.pk],
+                f'{prefix}-TOTAL_FORMS': 3,
+                f'{prefix}-INITIAL_FORMS': 2,
+                f'{prefix}-0-id': self.flour_row.pk,
+                f'{prefix}-0-recipe': self.recipe.pk,
+                f'{prefix}-0-ingredient': self.flour.pk,
+                f'{prefix}-0-amount': 150,
+                f'{prefix}-1-id': self.sugar_row.pk,
+                f'{prefix}-1-recipe': self.recipe.pk,
+                f'{prefix}-1-ingredient': self.sugar.pk,
+                f'{prefix}-1-amount': 20,
+                f'{prefix}-1-DELETE': 'on',
+                f'{prefix}-2-recipe': self.recipe.pk,
+                f'{prefix}-2-ingredient': self.salt.pk,
+                f'{prefix}-2-amount': 5,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_shopping_list(), {'мука': 150, 'соль': 5})
+
+
+class ShoppingListRebuildTests(TestCase):
+    def test_rebuild_selected_users_with_shared_recipe(self):
+        users = [create_user(index) for index in range(2)]
+        recipe = create_recipe(users[0])
+        (flour,) = create_ingredients('мука')
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=flour, amount=100
+        )
+        for user in users:
+            ShoppingCart.objects.create(
+                shoppingcart_user=user, shoppingcart_recipe=recipe
+            )
+        shopping_list.rebuild([users[0].pk])
+        self.assertEqual(
+            list(
+                ShoppingListItem.objects.order_by('user').values_list(
+                    'user', 'total_amount'
+                )
+            ),
+            [(users[0].pk, 100), (users[1].pk, 100)],
+        )
+        self.assertEqual(shopping_list.find_inconsistencies(), {})
+
+
+class QuantityPropertyTests(SimpleTestCase):
+    """Свойства перевода единиц на случайных, но воспроизводимых данных."""
+
+    seed = 20241018
+    examples = 2000
+
+    def setUp(self):
+        self.rng = random.Random(self.seed)
+
+    def random_amount(self):
+        return self.rng.choice(
+            (
+                self.rng.randint(1, 10),
+                self.rng.randint(1, 1000),
+                self.rng.randint(1, 10 ** 6),
+                self.rng.randint(1, 100) * 1000,
+            )
+        )
+
+    def test_round_trip_keeps_amount(self):
+        for _ in range(self.examples):
+            unit = self.rng.choice(list(UNITS))
+            amount = self.random_amount()
+            base = to_base(amount, unit)
+            name, value = from_base(base, UNITS[unit].dimension)
+            with self.subTest(amount=amount, unit=unit):
+                self.assertEqual(UNITS[name].dimension, UNITS[unit].dimension)
+                self.assertEqual(to_base(value, name), base)
+
+    def test_from_base_prefers_larger_exact_unit(self):
+        for _ in range(self.examples):
+            amount = self.random_amount()
+            name, value = from_base(amount, 'mass')
+            with self.subTest(amount=amount):
+                if amount >= 1000 and amount * 100 % 1000 == 0:
+                    self.assertEqual(name, 'кг')
+                else:
+                    self.assertEqual((name, value), ('г', amount))
+
+    def test_aggregate_keeps_totals_per_dimension(self):
+        names = ('мука', 'молоко', 'сахар')
+        units = list(UNITS) + ['шт.', 'по вкусу']
+        for _ in range(self.examples // 10):
+            rows = [
+                {
+                    'name': self.rng.choice(names),
+                    'measurement_unit': self.rng.choice(units),
+                    'total_amount': self.random_amount(),
+                }
+                for _ in range(self.rng.randint(1, 20))
+            ]
+            expected = {}
+            for row in rows:
+                unit = row['measurement_unit']
+                if unit in UNITS:
+                    key = (row['name'], UNITS[unit].dimension)
+                    amount = to_base(row['total_amount'], unit)
+                elif unit == 'по вкусу':
+                    key, amount = (row['name'], unit), None
+                else:
+                    key, amount = (row['name'], unit), row['total_amount']
+                if amount is None or key not in expected:
+                    expected[key] = amount
+                else:
+                    expected[key] += amount
+            actual = {}
+            for item in aggregate_quantities(rows):
+                unit = item['measurement_unit']
+                if unit in UNITS:
+                    key = (item['name'], UNITS[unit].dimension)
+                    amount = to_base(item['total_amount'], unit)
+                else:
+                    key, amount = (item['name'], unit), item['total_amount']
+                self.assertNotIn(key, actual)
+                actual[key] = amount
+            with self.subTest(rows=rows):
+                self.assertEqual(actual, expected)
+
+    def test_examples(self):
+        cases = (
+            ((('г', 1005),), ('г', 1005)),
+            ((('г', 1), ('кг', 2)), ('г', 2001)),
+            ((('г', 1200),), ('кг', Decimal('1.2'))),
+            ((('мл', 750), ('л', 1)), ('л', Decimal('1.75'))),
+            ((('ст. л.', 3),), ('ст. л.', 3)),
+            ((('стакан', 1), ('ч. л.', 1)), ('мл', 255)),
+            ((('по вкусу', 2),), ('по вкусу', None)),
+            ((('шт.', 2), ('шт.', 3)), ('шт.', 5)),
+        )
+        for rows, expected in cases:
+            with self.subTest(rows=rows):
+                (item,) = aggregate_quantities(
+                    {
+                        'name': 'x',
+                        'measurement_unit': unit,
+                        'total_amount': amount,
+                    }
+                    for unit, amount in rows
+                )
+                self.assertEqual(
+                    (item['measurement_unit'], item['total_amount']),
+                    expected,
+                )
+
+
+class InvalidationOnCommitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = create_recipe(create_user())
+
+    def test_cache_changes_only_after_commit(self):
+        key = RECIPE_KEY.format(self.recipe.pk)
+        cache.set(key, {'name': 'Рецепт'})
+        (version,) = get_versions('recipes')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+            self.assertEqual(get_versions('recipes'), [version])
+            self.assertEqual(cache.get(key), {'name': 'Рецепт'})
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_versions('recipes'), [version])
+        self.assertIsNone(cache.get(key))
+
+
+class RecordingSearchIndex(IngredientSearchIndex):
+    """Индекс, который вместо фонового потока запоминает пересборки."""
+
+    def __init__(self):
+        super().__init__()
+        self.rebuilds = []
+
+    def rebuild(self, version):
+        self.rebuilds.append(version)
+
+
+class IngredientSearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_ingredients('мука', 'мускат', 'сахар')
+
+    def setUp(self):
+        cache.clear()
+        self.index = RecordingSearchIndex()
+
+    def names(self, results):
+        return [ingredient.name for ingredient in results]
+
+    def test_cold_index_searches_db_and_rebuilds_in_background(self):
+        self.assertEqual(self.names(self.index.search('му', 10)), ['мука', 'мускат'])
+        self.assertEqual(len(self.index.rebuilds), 1)
+        self.assertIsNone(self.index._keys)
+
+    def test_built_index_is_used(self):
+        (version,) = get_versions('ingredients')
+        self.index.build(version)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(self.index.search('сах', 10)), ['сахар'])
+        self.assertEqual(self.index.rebuilds, [])
+
+    @override_settings(INGREDIENT_INDEX_TTL=0)
+    def test_expired_index_is_served_while_rebuilding(self):
+        (version,) = get_versions('ingredients')
+        self.index.build(version)
+        Ingredient.objects.filter(name='сахар').update(name='сахарная пудра')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(self.index.search('сах', 10)), ['сахар'])
+        self.assertEqual(self.index.rebuilds, [version])
+
+    def test_rebuild_is_skipped_while_another_is_running(self):
+        index = IngredientSearchIndex()
+        (version,) = get_versions('ingredients')
+        self.assertTrue(index._build_lock.acquire(blocking=False))
+        self.addCleanup(index._build_lock.release)
+        index.rebuild(version)
+        self.assertIsNone(index._keys)
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_auto_20240310_2302'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['subscriber', '-id'], name='subscription_subscriber_idx'),
+        ),
+    ]
@@ -77,3 +77,9 @@ class Subscription(models.Model):
                 name='check_self_subscription',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['subscriber', '-id'],
+                name='subscription_subscriber_idx',
+            )
+        ]